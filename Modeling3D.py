@@ -1,10 +1,66 @@
 import bpy
 import os
+import glob
+import json
 import math
-import bmesh
-from timeit import default_timer as timer
-
-from .settings import getSettings
+import hashlib
+import platform
+import time
+import traceback
+import numpy as np
+
+from . import bl_info
+from .settings import (
+    addSettingsListener,
+    checkSettings,
+    getSettings,
+    removeSettingsListener,
+)
+from .mesh_helpers import check_mesh
+from .datablocks import (
+    append_template,
+    file_digest,
+    memory_report,
+    purge_orphans,
+    remove_hierarchy,
+    remove_object,
+    write_template,
+)
+from .profiling import profiler
+from .quality import QUALITY, TIERS, Governor
+from .binary import SUFFIX, binary_name, read_grid, read_lines
+from .render import BatchRender
+from .trail import fill_gaps, resample_line, smooth, sweep
+from .vegetation import class_seed, instance_quads, sample_points
+from .transport import LayerServer
+from .workers import create_decoder, decode_patch, shared_folder
+from .watcher import Ingest, create_watcher
+from .grid import (
+    changed_cells,
+    dilate,
+    edge_mask,
+    lod_layout,
+    masked_layout,
+    tile_layouts,
+    uniform_layout,
+    wet_cells,
+)
+from .terrain import (
+    TerrainQuery,
+    drape,
+    grid_mesh,
+    grid_object,
+    mesh_from_arrays,
+    mesh_object,
+    prepare_terrain,
+    read_coordinates,
+    replace_mesh,
+    scene_origin,
+    set_material_index,
+    side_faces,
+    skirt_mask,
+    update_heights,
+)
 
 from bpy.props import (
     StringProperty,
@@ -18,47 +74,147 @@ terrainFile = "terrain.tif"
 waterFile = "water.tif"
 viewFile = "vantage.shp"
 trailFile = "trail.shp"
+layerFiles = (terrainFile, waterFile, viewFile, trailFile)
+profileFile = "tl_profile.jsonl"
+templateFile = "tl_assets_{}.blend"
+renderFolder = "renders"
+asset_materials = (
+    "terrain_material",
+    "terrain_sides_material",
+    "trail_material",
+    "water_material",
+    "fast_water_material",
+)
 dynamic_cam = "dynamic_camera"
 bird_cam = "bird_camera"
+trees_prefix = "trees_"
 CRS = "EPSG:3358"
 
 
 class Prefs:
-    def __init__(self):
-        folder = getSettings()["folder"]
+    def __init__(self, settings=None):
+        if settings is None:
+            settings = getSettings()
+        folder = settings["folder"]
         self.watchFolder = os.path.join(folder, watchName)
         self.terrainPath = os.path.join(self.watchFolder, terrainFile)
         self.terrain_texture_path = os.path.join(
-            folder, getSettings()["terrain"]["grass_texture_file"]
+            folder, settings["terrain"]["grass_texture_file"]
         )
         self.terrain_sides_texture_path = os.path.join(
-            folder, getSettings()["terrain"]["sides_texture_file"]
+            folder, settings["terrain"]["sides_texture_file"]
         )
         self.world_texture_path = os.path.join(
-            folder, getSettings()["world"]["texture_file"]
+            folder, settings["world"]["texture_file"]
         )
         self.trail_texture_path = os.path.join(
-            folder, getSettings()["trail"]["texture_file"]
+            folder, settings["trail"]["texture_file"]
         )
         self.water_path = os.path.join(self.watchFolder, waterFile)
         self.view_path = os.path.join(self.watchFolder, viewFile)
         self.trail_path = os.path.join(self.watchFolder, trailFile)
-        self.CRS = "EPSG:" + getSettings()["CRS"]
-        self.timer = getSettings()["timer"]
-        self.scale = getSettings()["scale"]
-        self.profile = os.path.join(folder, getSettings()["trail"]["profile"])
+        self.profile_log = os.path.join(folder, profileFile)
+        self.folder = folder
+        self.CRS = "EPSG:" + settings["CRS"]
+        self.timer = settings["timer"]
+        self.scale = settings["scale"]
+        # seconds a file must stay unmodified before it is read
+        self.settle = settings.get("settle", 0.25)
+        # Unix socket path or host:port layers can also be pushed to
+        self.socket = settings.get("socket")
+        # decode and build mesh arrays in worker processes instead of
+        # threads, off by default since it forks the whole Blender process
+        self.worker_processes = settings.get("worker_processes", False)
+        self.profile = os.path.join(folder, settings["trail"]["profile"])
         self.trees = {}
-        for c in getSettings()["trees"]:
+        for c in settings["trees"]:
             self.trees[c] = {}
-            self.trees[c]["model"] = os.path.join(
-                folder, getSettings()["trees"][c]["model"]
-            )
+            self.trees[c]["model"] = os.path.join(folder, settings["trees"][c]["model"])
             self.trees[c]["texture"] = os.path.join(
-                folder, getSettings()["trees"][c]["texture"]
+                folder, settings["trees"][c].get("texture", "")
             )
         self.tree_model_path = os.path.join(
-            folder, getSettings()["terrain"]["grass_texture_file"]
+            folder, settings["terrain"]["grass_texture_file"]
         )
+        # stills of every camera after terrain changes, rendered in the
+        # background by separate Blender processes
+        self.batch_render = settings.get("batch_render", False)
+        self.render_cameras = settings.get(
+            "render_cameras",
+            ["{}_{}".format(bird_cam, i) for i in range(5)] + [dynamic_cam],
+        )
+        self.render_workers = settings.get("render_workers")
+        self.render_engine = settings.get("render_engine", "CYCLES")
+
+
+# shared by watch mode and the render button
+renders = BatchRender(bpy.app.binary_path)
+
+
+def render_views():
+    """Renders the scene cameras in background processes without blocking.
+
+    The scene is written out on the next timer step, not during the layer
+    update asking for it. A request during a running batch renders once
+    more when it ends.
+    """
+    renders.pending = True
+    if not bpy.app.timers.is_registered(poll_renders):
+        bpy.app.timers.register(poll_renders, first_interval=0.1)
+
+
+def start_renders(prefs):
+    cameras = [c for c in prefs.render_cameras if bpy.data.objects.get(c)]
+    if not cameras:
+        return
+    folder = os.path.join(prefs.folder, renderFolder, time.strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(folder, exist_ok=True)
+    blend = os.path.join(folder, "scene.blend")
+    # only the scene and what it uses, without the UI and unused data
+    bpy.data.libraries.write(blend, {bpy.context.scene}, relative_remap=True)
+    renders.start(blend, cameras, folder, prefs.render_workers, prefs.render_engine)
+
+
+def poll_renders():
+    renders.poll()
+    if renders.pending and not renders.busy:
+        renders.pending = False
+        start_renders(Prefs())
+    return 0.5 if renders.busy or renders.pending else None
+
+
+def layer_name(file_name):
+    """Layer a watch folder file updates, patch files all update the trees"""
+    if file_name.startswith("patch_"):
+        return "trees"
+    return os.path.splitext(file_name)[0]
+
+
+def layer_file(file_name):
+    """GeoTIFF or shapefile name of a layer, also for its binary version"""
+    for layer in layerFiles:
+        if file_name == binary_name(layer):
+            return layer
+    return file_name
+
+
+def is_patch(file_name):
+    return file_name.startswith("patch_") and file_name.endswith((".png", SUFFIX))
+
+
+def is_layer(file_name):
+    """Whether a file updates one of the layers"""
+    return layer_file(file_name) in layerFiles or is_patch(file_name)
+
+
+def remove_layer_file(path):
+    """Removes an applied layer file, with the sidecars of a shapefile"""
+    os.remove(path)
+    if path.endswith(".shp"):
+        stem = os.path.splitext(path)[0]
+        for sidecar in (".shx", ".dbf", ".prj", ".cpg"):
+            if os.path.exists(stem + sidecar):
+                os.remove(stem + sidecar)
 
 
 def load_objects_from_file(filepath, scale=1):
@@ -84,35 +240,59 @@ def assign_material(object_name, material_name):
         bpy.ops.object.material_slot_assign()
 
 
-def create_particle_system(name, particle_object_name):
-    tex = bpy.data.textures.new(name, type="IMAGE")
-    # tex.image = bpy.data.images.load(filepath=texture_path)
-
-    tmp_plane = "Plane"
-    bpy.ops.mesh.primitive_plane_add()
-    obj = bpy.data.objects[tmp_plane]
-    mod = obj.modifiers.new(name=name, type="PARTICLE_SYSTEM")
-    mod.particle_system.settings.name = name
-    psys = bpy.data.particles[name]
-    mtex = psys.texture_slots.add()
-    mtex.texture = tex
-    psys.distribution = "RAND"
-    psys.render_type = "OBJECT"
-    psys.use_rotations = True
-    psys.rotation_mode = "OB_Z"
-    psys.use_rotation_instance = True
-    psys.phase_factor_random = 2
-    psys.particle_size = 1
-    psys.size_random = 0.5
-    psys.count = 1000
-    psys.use_emit_random = True
-    psys.use_modifier_stack = True
-    psys.use_even_distribution = False
-
-    psys.instance_object = bpy.data.objects[particle_object_name]
-    psys.use_fake_user = True
-
-    remove_object(tmp_plane)
+def create_vegetation(name, tree_object_name):
+    """Object instancing a tree class on its faces, filled by Adapt.trees.
+
+    An existing instancer keeps its trees and only swaps the tree model.
+    """
+    obj = bpy.data.objects.get(trees_prefix + name)
+    if obj is None:
+        mesh = bpy.data.meshes.new(trees_prefix + name)
+        obj = bpy.data.objects.new(trees_prefix + name, mesh)
+        bpy.context.scene.collection.objects.link(obj)
+        obj.instance_type = "FACES"
+        obj.use_instance_faces_scale = True
+    for child in obj.children:
+        if child.name != tree_object_name:
+            remove_object(child.name)
+    tree = bpy.data.objects[tree_object_name]
+    tree.parent = obj
+    # the instancer hides the original tree
+    tree.hide_set(False)
+
+
+def apply_quality(quality):
+    """Scene wide part of a realism tier: samples, textures and filtering"""
+    scene = bpy.context.scene
+    scene.eevee.taa_samples = quality["samples"]
+    scene.eevee.taa_render_samples = quality["samples"] * 4
+    if hasattr(scene, "cycles"):
+        scene.cycles.preview_samples = quality["samples"]
+    bpy.context.preferences.system.gl_texture_limit = quality["texture_limit"]
+    for name in ("terrain_material", "terrain_sides_material", "trail_material"):
+        material = bpy.data.materials.get(name)
+        if material and material.node_tree:
+            for node in material.node_tree.nodes:
+                if node.type == "TEX_IMAGE":
+                    node.interpolation = quality["interpolation"]
+
+
+def rescale_assets(factor):
+    """Scales the tree models and the trail profile loaded from files"""
+    for obj in bpy.data.objects:
+        if obj.name.startswith(trees_prefix):
+            for child in obj.children:
+                child.scale *= factor
+    profile = bpy.data.objects.get("T_profile")
+    if profile:
+        profile.scale *= factor
+
+
+def clear_vegetation():
+    for obj in bpy.data.objects:
+        if obj.name.startswith(trees_prefix):
+            replace_mesh(obj, bpy.data.meshes.new(obj.name))
+            obj.pop("patch", None)
 
 
 def create_terrain_material(name, texture_path, sides):
@@ -159,6 +339,8 @@ def create_trail_material(name, texture_path):
 def create_fast_water_material(name):
     mat = bpy.data.materials.new(name=name)
     mat.use_nodes = True
+    # the transparent mix needs alpha blending in the viewport
+    mat.blend_method = "BLEND"
     nodes = mat.node_tree.nodes
     output = nodes["Material Output"]
     diffuse = nodes.new("ShaderNodeBsdfDiffuse")
@@ -176,6 +358,8 @@ def create_fast_water_material(name):
 def create_water_material(name):
     mat = bpy.data.materials.new(name=name)
     mat.use_nodes = True
+    # the transparent mix needs alpha blending in the viewport
+    mat.blend_method = "BLEND"
     nodes = mat.node_tree.nodes
     output = nodes["Material Output"]
     transparent = nodes.new("ShaderNodeBsdfTransparent")
@@ -224,81 +408,42 @@ def add_sun():
 
 
 def addSide(objName, mat):
-    ter = bpy.data.objects[objName]
-    fringe = ter.dimensions.x / 20
-    ter.select_set(True)
+    """Drops the grid boundary into a skirt and textures its side faces.
 
-    bpy.ops.object.mode_set(mode="EDIT")
-    bpy.ops.mesh.select_all(action="DESELECT")
+    Returns the skirt vertex mask and depth for later in place updates.
+    """
+    ter = bpy.data.objects[objName]
     me = ter.data
-
-    if ter.mode == "EDIT":
-        bm = bmesh.from_edit_mesh(ter.data)
-        vertices = bm.verts
-
+    co = read_coordinates(me)
+    # from the new vertices, the object bounds wait for a depsgraph update
+    fringe = (np.nanmax(co[:, 0]) - np.nanmin(co[:, 0])) / 20
+    skirt = skirt_mask(co)
+    update_heights(ter, co[:, 2], skirt, fringe)
+    sides = bpy.data.materials.get("terrain_sides_material")
+    if me.materials.find(sides.name) < 0:
+        me.materials.append(sides)
+    set_material_index(me, side_faces(me), me.materials.find(sides.name))
+    return skirt, fringe
+
+
+def terrain_dimensions(georef, z, fringe):
+    """Size of the terrain from its raster and heights, with the skirt"""
+    xmin, ymin, xmax, ymax = georef.extent
+    return xmax - xmin, ymax - ymin, float(np.nanmax(z) - np.nanmin(z) + fringe)
+
+
+def profile_points(obj):
+    """Cross section of a bevel object in its scale, and if it is closed"""
+    scale = np.array(obj.scale[:2])
+    if obj.type == "MESH":
+        points = [v.co[:2] for v in obj.data.vertices]
+        return np.array(points) * scale, False
+    spline = obj.data.splines[0]
+    if spline.type == "BEZIER":
+        points = [p.co[:2] for p in spline.bezier_points]
     else:
-        vertices = ter.data.vertices
-
-    verts = [ter.matrix_world @ vert.co for vert in vertices]
-
-    dic = {"x": [], "y": [], "z": []}
-    for vert in verts:
-        if not math.isnan(vert[0]):
-            dic["x"].append(vert[0])
-            dic["y"].append(vert[1])
-            dic["z"].append(vert[2])
-
-    xmin = min(dic["x"])
-    xmax = max(dic["x"])
-    ymin = min(dic["y"])
-    ymax = max(dic["y"])
-    zmin = min(dic["z"])
-
-    tres = 0.1
-
-    for vert in vertices:
-        if vert.co[0] < xmin + tres and vert.co[0] > xmin - tres:
-            vert.select_set(True)
-            vert.co[2] = zmin - fringe
-
-        elif vert.co[1] < ymin + tres and vert.co[1] > ymin - tres:
-            vert.select_set(True)
-            vert.co[2] = zmin - fringe
-
-        elif vert.co[0] < xmax + tres and vert.co[0] > xmax - tres:
-            vert.select_set(True)
-            vert.co[2] = zmin - fringe
-        elif vert.co[1] < ymax + tres and vert.co[1] > ymax - tres:
-            vert.select_set(True)
-            vert.co[2] = zmin - fringe
-
-    bmesh.update_edit_mesh(me, True)
-
-    def NormalInDirection(normal, direction, limit=0.5):
-        return direction.dot(normal) > limit
-
-    def GoingUp(normal, limit=0.5):
-        return NormalInDirection(normal, Vector((0, 0, 1)), limit)
-
-    def GoingDown(normal, limit=0.5):
-        return NormalInDirection(normal, Vector((0, 0, -1)), limit)
-
-    def GoingSide(normal, limit=0.2):
-        return GoingUp(normal, limit) is False and GoingDown(normal, limit) is False
-
-    bpy.ops.object.mode_set(mode="OBJECT", toggle=False)
-
-    # Selects faces going side
-
-    for face in ter.data.polygons:
-        face.select = GoingSide(face.normal)
-
-    bpy.ops.object.mode_set(mode="EDIT", toggle=False)
-
-    assign_material(objName, "terrain_sides_material")
-    bpy.ops.object.material_slot_assign()
-
-    bpy.ops.object.mode_set(mode="OBJECT", toggle=False)
+        points = [p.co[:2] for p in spline.points]
+    return np.array(points) * scale, spline.use_cyclic_u
 
 
 def create_dynamic_camera():
@@ -354,6 +499,9 @@ def toggle_camera(name):
     camera = bpy.data.objects[name]
     bpy.context.scene.camera = camera
     bpy.context.view_layer.objects.active = camera
+    if bpy.context.screen is None:
+        # running in background
+        return
 
     area = next(area for area in bpy.context.screen.areas if area.type == "VIEW_3D")
     area.spaces[0].region_3d.view_perspective = "CAMERA"
@@ -374,13 +522,22 @@ def select_only(object_name):
     return None
 
 
-def remove_object(object_name):
-    if bpy.data.objects.get(object_name):
-        bpy.data.objects.remove(bpy.data.objects[object_name])
+def object_size(obj):
+    """Largest side of the bounding box, spanning the children of an empty"""
+    objects = obj.children if obj.type == "EMPTY" else [obj]
+    corners = [
+        child.matrix_world @ Vector(corner)
+        for child in objects
+        for corner in child.bound_box
+    ]
+    if not corners:
+        return 0
+    corners = np.array(corners)
+    return float((corners.max(axis=0) - corners.min(axis=0)).max())
 
 
 def adjust_bird_cameras(object):
-    dst = round(max(object.dimensions))
+    dst = round(object_size(object))
     k = 1.5  # increase factor
     kdst = dst * k
 
@@ -406,7 +563,7 @@ def adjust_bird_cameras(object):
 
 
 def adjust_sun(object):
-    dst = round(max(object.dimensions))
+    dst = round(object_size(object))
     k = 2  # increase factor
     kdst = dst * k
     bpy.data.objects["Sun"].data.shadow_cascade_max_distance = kdst
@@ -416,9 +573,11 @@ def adjust_sun(object):
 def adjust3Dview(object):
     """Adjust all 3d views clip distance to match the submited bbox.
     From BlenderGIS addon."""
-    dst = round(max(object.dimensions))
+    dst = round(object_size(object))
     k = 5  # increase factor
     dst = dst * k
+    if bpy.context.screen is None:
+        return
     # set each 3d view
     areas = bpy.context.screen.areas
     for area in areas:
@@ -451,119 +610,508 @@ class Adapt:
         self.view = "vantage"
         self.trail = "trail"
         self.dimensions = None
+        self.profiler = profiler
+        # every step-th raster cell becomes a vertex
+        self.step = 2
+        # grid of the current terrain, used to update heights in place
+        self.terrainGrid = None
+        self.terrainSkirt = None
+        self.terrainFringe = None
+        # tile layouts, their skirt masks, the heights every tile shows and
+        # the height the skirts hang from
+        self.tiles = {}
+        self.tileSkirts = {}
+        self.tileHeights = {}
+        self.terrainFloor = None
+        # problem counts of the last mesh check of every checked object
+        self.meshProblems = {}
+        # last terrain raster with height and ray queries shared by trees,
+        # trails and cameras
+        self.terrainQuery = None
+        # camera the terrain detail was refined for
+        self.terrainEye = None
+        # last density and checksum of every tree class, replanted when
+        # the realism tier changes
+        self.treePatches = {}
+        self.realism = "High"
+        self.configure(getSettings())
+
+    @property
+    def quality(self):
+        return QUALITY[self.realism]
+
+    def setRealism(self, tier):
+        """Switches the realism tier of the scene and of everything built"""
+        self.realism = tier
+        quality = self.quality
+        apply_quality(quality)
+        water = bpy.data.objects.get(self.water)
+        material = bpy.data.materials.get(quality["water_material"])
+        if water and water.material_slots and material:
+            # also for materials from templates saved without it
+            material.blend_method = "BLEND"
+            water.material_slots[0].material = material
+        if self.terrainQuery is not None:
+            for patch_type, (density, checksum) in self.treePatches.items():
+                obj = bpy.data.objects.get(trees_prefix + patch_type)
+                if obj:
+                    self.plant(obj, patch_type, density)
+                    obj["patch"] = self.patchKey(checksum)
+        bpy.context.scene["tl_realism"] = tier
+        self.profiler.meta["realism"] = tier
+
+    def patchKey(self, checksum):
+        """What the trees of a class depend on besides the model.
+
+        Terrain updates on the same grid drape the trees, only a new grid
+        needs them planted again.
+        """
+        grid = self.terrainQuery.georef.key
+        return "{:08x}:{}:{}".format(checksum, grid, self.realism)
+
+    def configure(self, settings):
+        """Takes over the tunable settings, also while watch mode runs"""
+        # coarser cells away from the active camera
+        self.lod = settings.get("lod", False)
+        # cells per side of terrain tiles updated on their own, 0 for one
+        # terrain object, tiles ignore lod
+        self.tileSize = settings.get("terrain_tile", 0)
+        # meters a height has to move to update its tile
+        self.tileTolerance = settings.get("terrain_tolerance", 0.01)
+        # mesh checks after terrain and water updates, the intersection
+        # and thickness checks build a BVH and are off by default
+        qa = settings.get("qa", {})
+        self.qa = qa.get("enabled", True)
+        self.qaIntersections = qa.get("intersections", False)
+        self.qaThickness = qa.get("thickness", 0)
+        # triangles the thickness check samples, all when not set
+        self.qaSamples = qa.get("samples")
+        # water shallower than depth is dry, wet areas grow by a few cells
+        water = settings.get("water", {})
+        self.waterDepth = water.get("depth", 0.05)
+        self.waterGrow = water.get("grow", 1)
+        # trees per hectare where a patch is white
+        self.treeDensity = {
+            c: tree.get("density", 100) for c, tree in settings["trees"].items()
+        }
+        # tree models, loaded when the first patch of their class arrives
+        self.treeModels = {
+            c: os.path.join(settings["folder"], tree["model"])
+            for c, tree in settings["trees"].items()
+        }
+        self.scale = settings["scale"]
+
+    def eye(self):
+        """Active camera name and rounded location, None without a camera"""
+        camera = bpy.context.scene.camera
+        if camera is None:
+            return None
+        location = camera.matrix_world.translation
+        return camera.name, tuple(round(v) for v in location)
+
+    def terrainParams(self, origin=None):
+        """Origin, step and eye terrain arrays are built for right now.
+
+        Without an origin the scene one is used, None when not set yet.
+        """
+        if origin is None:
+            scn = bpy.context.scene
+            if "crs x" in scn and "crs y" in scn:
+                origin = scn["crs x"], scn["crs y"]
+        if self.tileSize:
+            # tiles are built on the main thread, only where they changed
+            return origin and tuple(origin), None, None
+        eye = self.eye() if self.lod else None
+        return origin and tuple(origin), self.step, eye
+
+    def layout(self, data, georef, CRS):
+        eye = self.eye()
+        if not self.lod or eye is None:
+            return uniform_layout(georef.shape, self.step)
+        origin = scene_origin(georef.center, CRS)
+        return lod_layout(data, georef, origin, eye[1], step=self.step)
+
+    def refine(self, CRS):
+        """Rebuilds the terrain detail when the active camera moved or changed"""
+        if not self.lod or self.tileSize or self.terrainQuery is None:
+            return
+        eye = self.eye()
+        terrain = bpy.data.objects.get(self.plane)
+        if eye == self.terrainEye or terrain is None:
+            return
+        self.terrainEye = eye
+        data, georef = self.terrainQuery.data, self.terrainQuery.georef
+        self.profiler.begin("lod", [])
+        stage = self.profiler.stage
+        with stage("mesh"):
+            layout = self.layout(data, georef, CRS)
+            grid = (georef.key, layout.key)
+            if grid == self.terrainGrid:
+                self.profiler.cancel()
+                return
+            # swap the mesh to keep modifiers, constraints and materials
+            replace_mesh(terrain, grid_mesh(self.plane, data, georef, CRS, layout))
+            self.terrainGrid = grid
+        with stage("side"):
+            self.terrainSkirt, self.terrainFringe = addSide(
+                self.plane, "terrain_material"
+            )
+        self.profiler.end()
 
-    def terrainChange(self, path, CRS):
-        # TODO: apply previous particle systems
-        adjust_view = True
-        if bpy.data.objects.get(self.plane):
-            adjust_view = False
-        remove_object(self.plane)
-        bpy.ops.importgis.georaster(
-            filepath=path,
-            importMode="DEM",
-            subdivision="mesh",
-            step=2,
-            rastCRS=CRS,
-        )
-        select_only(self.plane)
-        bpy.ops.object.convert(target="MESH")
-        self.dimensions = bpy.data.objects["terrain"].dimensions
-        assign_material(self.plane, material_name="terrain_material")
-        addSide(self.plane, "terrain_material")
-        os.remove(path)
-        if adjust_view:
-            t = bpy.data.objects.get(self.plane)
-            adjust3Dview(t)
-            adjust_bird_cameras(t)
-            adjust_sun(t)
+    def terrainChange(self, path, CRS, decoded=None):
+        stage = self.profiler.stage
+        with stage("decode"):
+            if decoded:
+                data, georef, prepared = decoded[0]
+            else:
+                data, georef, prepared = prepare_terrain(path, *self.terrainParams())
+        old = bpy.data.objects.get(self.plane)
+        if old and (old.type == "EMPTY") != bool(self.tileSize):
+            # switched between one terrain object and tiles
+            remove_hierarchy(self.plane)
+            self.terrainGrid = None
+            old = None
+        adjust_view = old is None
+        origin = scene_origin(georef.center, CRS)
+        before = self.terrainQuery
+        self.terrainQuery = TerrainQuery(data, georef, origin, self.plane)
+        self.terrainEye = self.eye()
+        if self.tileSize:
+            changed = self.terrainTiles(data, georef, origin, before)
         else:
-            for obj in bpy.data.objects:
-                if obj.name.startswith(bird_cam):
-                    obj.constraints["Track To"].target = bpy.data.objects[self.plane]
-
-    def waterFill(self, path, CRS):
-        remove_object(self.water)
-        bpy.ops.importgis.georaster(
-            filepath=path, importMode="DEM", subdivision="mesh", step=2, rastCRS=CRS
-        )
-        select_only(self.water)
-        bpy.ops.object.convert(target="MESH")
-        assign_material(self.water, material_name="water_material")
-        bpy.context.object.active_material.blend_method = "BLEND"
-        os.remove(path)
-
-    def camera_view(self, path, CRS):
-        remove_object(self.view)
-        bpy.ops.importgis.shapefile(filepath=path, shpCRS=CRS)
-        van_line = bpy.data.objects[self.view]
-        van_line.hide_set(True)
-        cam = bpy.data.objects[dynamic_cam]
-        target = bpy.data.objects[dynamic_cam + "_target"]
-
-        me = van_line.to_mesh()
-        me.transform(van_line.matrix_world)
-        cam.location = [
-            me.vertices[0].co.x,
-            me.vertices[0].co.y,
-            me.vertices[0].co.z + 5,
-        ]
-        target.location = [
-            me.vertices[-1].co.x,
-            me.vertices[-1].co.y,
-            me.vertices[0].co.z + 2,
-        ]
-        toggle_camera(dynamic_cam)
-        os.remove(path)
-
-    def trees(self, patch_files, watchFolder):
-        try:
-            terrain = bpy.data.objects[self.plane]
-        except KeyError:
-            print("no terrain for particles")
+            self.terrainMesh(data, georef, origin, prepared, CRS)
+            changed = [self.plane]
+        with stage("qa"):
+            self.checkMeshes(changed)
+        with stage("trees"):
+            # trees keep standing on the ground where the terrain moved
+            if before is not None:
+                for obj in bpy.data.objects:
+                    if obj.name.startswith(trees_prefix) and obj.type == "MESH":
+                        drape(obj.data, before, self.terrainQuery)
+        with stage("remove"):
+            os.remove(path)
+        with stage("cameras"):
+            if adjust_view:
+                # bounding boxes of the new mesh
+                bpy.context.view_layer.update()
+                t = bpy.data.objects.get(self.plane)
+                adjust3Dview(t)
+                adjust_bird_cameras(t)
+                adjust_sun(t)
+
+    def checkMeshes(self, names):
+        """Reports holes, bad faces and the like before they show up in renders"""
+        if not self.qa:
             return
-        while terrain.modifiers:
-            terrain.modifiers.remove(terrain.modifiers[-1])
-        for patch_file in patch_files:
-            path = os.path.join(watchFolder, patch_file)
-            patch_type = os.path.splitext(patch_file)[0].split("_")[1]
-            if bpy.data.images.get(patch_file):
-                bpy.data.images.remove(bpy.data.images[patch_file])
-            bpy.data.textures[patch_type].image = bpy.data.images.load(path)
-            bpy.data.images[patch_file].pack()
-            terrain.modifiers.new(name=patch_type, type="PARTICLE_SYSTEM")
-            terrain.particle_systems[patch_type].settings = bpy.data.particles[
-                patch_type
+        for name in names:
+            obj = bpy.data.objects.get(name)
+            if obj is None or obj.type != "MESH":
+                continue
+            problems = check_mesh(
+                obj.data,
+                intersections=self.qaIntersections,
+                thickness=self.qaThickness,
+                samples=self.qaSamples,
+            )
+            self.meshProblems[name] = {k: len(v) for k, v in problems.items()}
+            if problems:
+                found = ", ".join(
+                    "{} {}".format(len(faces), kind) for kind, faces in problems.items()
+                )
+                print("Mesh problems in {}: {} faces".format(name, found))
+
+    def terrainMesh(self, data, georef, origin, prepared, CRS):
+        """Updates the terrain as one object"""
+        stage = self.profiler.stage
+        old = bpy.data.objects.get(self.plane)
+        layout = None
+        if prepared is not None and prepared[0] == self.terrainParams(origin):
+            params, key, co, faces, uv = prepared
+        else:
+            # settings or camera changed since the arrays were built
+            layout = self.layout(data, georef, CRS)
+            key = layout.key
+        grid = (georef.key, key)
+        if old and grid == self.terrainGrid:
+            # same grid, only the heights change, keep materials, skirt,
+            # modifiers and constraints
+            with stage("mesh"):
+                z = co[:, 2] if layout is None else layout.heights(data)
+                update_heights(old, z, self.terrainSkirt, self.terrainFringe)
+                self.dimensions = terrain_dimensions(georef, z, self.terrainFringe)
+            with stage("side"):
+                # faces that got steep or flat change material
+                mesh = old.data
+                sides = mesh.materials.find("terrain_sides_material")
+                index = np.where(side_faces(mesh), sides, 0).astype(np.int32)
+                mesh.polygons.foreach_set("material_index", index)
+                mesh.update()
+            return
+        if layout is not None:
+            faces = layout.faces
+            co, uv = layout.arrays(data, georef, origin)
+        with stage("mesh"):
+            mesh = mesh_from_arrays(self.plane, co, faces, uv)
+            if old:
+                # reuse the object, its materials, modifiers and constraints
+                replace_mesh(old, mesh)
+            else:
+                mesh_object(self.plane, mesh)
+            self.terrainGrid = grid
+        with stage("materials"):
+            if not old:
+                assign_material(self.plane, material_name="terrain_material")
+        with stage("side"):
+            self.terrainSkirt, self.terrainFringe = addSide(
+                self.plane, "terrain_material"
+            )
+        self.dimensions = terrain_dimensions(georef, co[:, 2], self.terrainFringe)
+
+    def terrainTiles(self, data, georef, origin, before):
+        """Updates the terrain tiles whose cells changed, returns their names.
+
+        A new grid rebuilds every tile. Tiles are compared with the heights
+        they show, so that changes below the tolerance add up until the
+        tile gets updated. Skirts of all tiles hang from the same floor,
+        which only goes down, so that their sides line up.
+        """
+        stage = self.profiler.stage
+        step = self.step
+        grid = (georef.key, ("tiles", step, self.tileSize))
+        root = bpy.data.objects.get(self.plane)
+        floor = np.nanmin(data)
+        rebuild = root is None or before is None or grid != self.terrainGrid
+        cells = data[::step, ::step]
+        with stage("diff"):
+            if rebuild:
+                self.tiles = tile_layouts(georef.shape, step, self.tileSize)
+                self.tileHeights = {}
+                self.tileSkirts = {
+                    key: edge_mask(layout, georef.shape, step)
+                    for key, (layout, samples) in self.tiles.items()
+                }
+                xmin, ymin, xmax, ymax = georef.extent
+                self.terrainFringe = (xmax - xmin) / 20
+                self.terrainFloor = floor
+                dirty = list(self.tiles)
+            else:
+                dirty = []
+                for key, (layout, (rows, cols)) in self.tiles.items():
+                    shown = self.tileHeights[key]
+                    if changed_cells(
+                        shown, cells[rows, cols], self.tileTolerance
+                    ).any():
+                        dirty.append(key)
+                    elif floor < self.terrainFloor and self.tileSkirts[key].any():
+                        # deeper skirts, also where nothing else changed
+                        dirty.append(key)
+                self.terrainFloor = min(self.terrainFloor, floor)
+            for key in dirty:
+                rows, cols = self.tiles[key][1]
+                self.tileHeights[key] = np.array(cells[rows, cols])
+        with stage("mesh"):
+            if rebuild:
+                if root is None:
+                    root = bpy.data.objects.new(self.plane, None)
+                    bpy.context.scene.collection.objects.link(root)
+                else:
+                    # keep the root, cameras track it
+                    for child in list(root.children):
+                        remove_hierarchy(child.name)
+                self.terrainGrid = grid
+            materials = [
+                bpy.data.materials.get("terrain_material"),
+                bpy.data.materials.get("terrain_sides_material"),
             ]
-            for p in bpy.data.particles:
-                if p.users == 0:
-                    bpy.data.particles.remove(p)
+            fringe = self.terrainFringe
+            for key in dirty:
+                layout, samples = self.tiles[key]
+                skirt = self.tileSkirts[key]
+                name = "{}_{}_{}".format(self.plane, *key)
+                tile = bpy.data.objects.get(name)
+                if rebuild or tile is None:
+                    co, uv = layout.arrays(data, georef, origin)
+                    co[skirt, 2] = self.terrainFloor - fringe
+                    mesh = mesh_from_arrays(name, co, layout.faces, uv)
+                    for material in materials:
+                        mesh.materials.append(material)
+                    tile = bpy.data.objects.new(name, mesh)
+                    bpy.context.scene.collection.objects.link(tile)
+                    tile.parent = root
+                else:
+                    z = layout.heights(data)
+                    update_heights(tile, z, skirt, fringe, self.terrainFloor)
+            if rebuild:
+                # bounding boxes for the views and cameras
+                bpy.context.view_layer.update()
+        with stage("side"):
+            for key in dirty:
+                mesh = bpy.data.objects["{}_{}_{}".format(self.plane, *key)].data
+                sides = side_faces(mesh).astype(np.int32)
+                mesh.polygons.foreach_set("material_index", sides)
+                mesh.update()
+        xmin, ymin, xmax, ymax = georef.extent
+        depth = np.nanmax(data) - self.terrainFloor + fringe
+        self.dimensions = (xmax - xmin, ymax - ymin, depth)
+        return ["{}_{}_{}".format(self.plane, *key) for key in dirty]
+
+    def waterFill(self, path, CRS, decoded=None):
+        stage = self.profiler.stage
+        with stage("decode"):
+            data, georef = decoded[0] if decoded else read_grid(path)
+        old = bpy.data.objects.get(self.water)
+        with stage("mesh"):
+            step = self.step
+            surface = data[::step, ::step]
+            terrain = None
+            query = self.terrainQuery
+            if query and query.georef.key == georef.key:
+                terrain = query.data[::step, ::step]
+            wet = wet_cells(surface, terrain, self.waterDepth)
+            surface, wet = dilate(surface, wet, self.waterGrow)
+            layout = masked_layout(wet, georef.shape, step)
+            if not len(layout.faces):
+                remove_object(self.water)
+                old = None
+            else:
+                data = data.copy()
+                data[::step, ::step] = surface
+                if old:
+                    replace_mesh(old, grid_mesh(self.water, data, georef, CRS, layout))
+                else:
+                    grid_object(self.water, data, georef, CRS, layout)
+        with stage("materials"):
+            if not old and bpy.data.objects.get(self.water):
+                material = self.quality["water_material"]
+                assign_material(self.water, material_name=material)
+                # also for materials from templates saved without it
+                bpy.data.materials[material].blend_method = "BLEND"
+        with stage("qa"):
+            self.checkMeshes([self.water])
+        with stage("remove"):
             os.remove(path)
 
-    def trails(self, trail_path, CRS):
-        if not bpy.data.objects.get(self.plane):
-            return
-        remove_object(self.trail)
-        bpy.ops.importgis.shapefile(
-            filepath=trail_path, elevSource="OBJ", objElevName=self.plane, shpCRS=CRS
+    def camera_view(self, path, CRS, decoded=None):
+        stage = self.profiler.stage
+        with stage("decode"):
+            parts = decoded[0] if decoded else read_lines(path)
+        with stage("cameras"):
+            points = np.concatenate(parts)
+            center = (points[:, :2].min(axis=0) + points[:, :2].max(axis=0)) / 2
+            x, y = scene_origin(center, CRS)
+            cam = bpy.data.objects[dynamic_cam]
+            target = bpy.data.objects[dynamic_cam + "_target"]
+
+            ends = points[[0, -1]] - [x, y, 0]
+            if self.terrainQuery:
+                # stand on the terrain, the vantage points often have no z
+                ground = self.terrainQuery.heights(ends[:, 0], ends[:, 1])
+                ends[:, 2] = np.where(np.isfinite(ground), ground, ends[:, 2])
+            cam.location = ends[0] + [0, 0, 5]
+            target.location = ends[1] + [0, 0, 2]
+            toggle_camera(dynamic_cam)
+        with stage("remove"):
+            remove_layer_file(path)
+
+    def plant(self, obj, patch_type, density):
+        """Fills the instancer of a tree class following the patch density"""
+        query = self.terrainQuery
+        x, y = query.origin
+        rate = self.treeDensity.get(patch_type, 100) / 10000
+        rate *= self.quality["tree_density"]
+        xy, angle, sizes = sample_points(
+            density, query.georef.extent, rate, class_seed(patch_type)
         )
-        t = bpy.data.objects[self.trail]
-        select_only(self.trail)
-        bpy.ops.object.convert(target="CURVE")
-        bpy.context.object.data.bevel_object = bpy.data.objects["T_profile"]
-        bpy.context.object.data.bevel_mode = "OBJECT"
-        bpy.context.object.data.twist_mode = "Z_UP"
-        bpy.context.object.data.twist_smooth = 10
-        bpy.context.object.data.use_fill_caps = True
-        t.location[2] = t.location[2] + 1
-        assign_material(self.trail, material_name="trail_material")
-        modifier = t.modifiers.new(name="Smooth", type="SMOOTH")
-        modifier.factor = 0.5
-        modifier.iterations = 2
-        os.remove(trail_path)
-        files = os.listdir(os.path.dirname(trail_path))
-        for f in files[:]:
-            if os.path.basename(trail_path).split(".")[0] in f:
-                os.remove(os.path.join(os.path.dirname(trail_path), f))
+        xy -= [x, y]
+        z = query.heights(xy[:, 0], xy[:, 1])
+        keep = np.isfinite(z)
+        co = np.column_stack([xy[keep], z[keep]])
+        co, faces = instance_quads(co, angle[keep], sizes[keep])
+        replace_mesh(obj, mesh_from_arrays(obj.name, co, faces))
+
+    def vegetation(self, patch_type):
+        """Instancer of a tree class, loading its tree model on first use"""
+        obj = bpy.data.objects.get(trees_prefix + patch_type)
+        if obj is None and patch_type in self.treeModels:
+            tree_names = load_objects_from_file(
+                self.treeModels[patch_type], scale=self.scale
+            )
+            create_vegetation(patch_type, tree_object_name=tree_names[0])
+            obj = bpy.data.objects.get(trees_prefix + patch_type)
+        return obj
+
+    def trees(self, patch_files, watchFolder, CRS, decoded=None):
+        stage = self.profiler.stage
+        if self.terrainQuery is None or not bpy.data.objects.get(self.plane):
+            print("no terrain for trees")
+            return
+        for i, patch_file in enumerate(patch_files):
+            path = os.path.join(watchFolder, patch_file)
+            name = os.path.basename(patch_file)
+            patch_type = os.path.splitext(name)[0].split("_")[1]
+            with stage("decode"):
+                density, checksum = decoded[i] if decoded else decode_patch(path)
+            with stage("assets"):
+                obj = self.vegetation(patch_type)
+            with stage("instances"):
+                # unchanged classes keep their trees
+                key = self.patchKey(checksum)
+                if obj is None:
+                    print("no tree model for {}".format(patch_type))
+                elif obj.get("patch") != key:
+                    self.treePatches[patch_type] = density, checksum
+                    self.plant(obj, patch_type, density)
+                    obj["patch"] = key
+            with stage("remove"):
+                os.remove(path)
+
+    def trails(self, trail_path, CRS, decoded=None):
+        stage = self.profiler.stage
+        if self.terrainQuery is None or not bpy.data.objects.get(self.plane):
+            return
+        with stage("decode"):
+            parts = decoded[0] if decoded else read_lines(trail_path)
+        with stage("mesh"):
+            query = self.terrainQuery
+            x, y = query.origin
+            profile, closed = profile_points(bpy.data.objects["T_profile"])
+            spacing = abs(query.georef.pixel_size[0]) * self.step
+            co, faces, uv = [], [], []
+            count = 0
+            for part in parts:
+                if len(part) < 2:
+                    continue
+                xy = resample_line(part, spacing) - [x, y]
+                z = fill_gaps(query.heights(xy[:, 0], xy[:, 1]))
+                if not np.isfinite(z).any():
+                    continue
+                iterations = self.quality["trail_smooth"]
+                path = np.column_stack([xy, smooth(z, iterations=iterations) + 1])
+                part_co, part_faces, part_uv = sweep(path, profile, closed)
+                co.append(part_co)
+                faces.append(part_faces + count)
+                uv.append(part_uv)
+                count += len(part_co)
+            if not co:
+                remove_object(self.trail)
+            else:
+                mesh = mesh_from_arrays(
+                    self.trail,
+                    np.concatenate(co),
+                    np.concatenate(faces),
+                    np.concatenate(uv),
+                )
+                old = bpy.data.objects.get(self.trail)
+                if old and old.type == "MESH":
+                    replace_mesh(old, mesh)
+                else:
+                    remove_object(self.trail)
+                    obj = bpy.data.objects.new(self.trail, mesh)
+                    bpy.context.scene.collection.objects.link(obj)
+                    mesh.materials.append(bpy.data.materials.get("trail_material"))
+        with stage("remove"):
+            remove_layer_file(trail_path)
 
 
 class ModalTimerOperator(bpy.types.Operator):
@@ -576,6 +1124,7 @@ class ModalTimerOperator(bpy.types.Operator):
 
     def modal(self, context, event):
         if event.type in {"RIGHTMOUSE", "ESC"}:
+            self.cancel(context)
             return {"CANCELLED"}
 
         # this condition encomasses all the actions required for watching
@@ -585,28 +1134,163 @@ class ModalTimerOperator(bpy.types.Operator):
 
             if self._timer.time_duration != self._timer_count:
                 self._timer_count = self._timer.time_duration
-                fileList = os.listdir(self.prefs.watchFolder)
-                try:
-                    if terrainFile in fileList:
-                        self.adapt.terrainChange(self.prefs.terrainPath, self.prefs.CRS)
-                    if waterFile in fileList:
-                        self.adapt.waterFill(self.prefs.water_path, self.prefs.CRS)
-                    if viewFile in fileList:
-                        self.adapt.camera_view(self.prefs.view_path, self.prefs.CRS)
-
-                    if trailFile in fileList:
-                        self.adapt.trails(self.prefs.trail_path, self.prefs.CRS)
-                    patch_files = []
-                    for f in fileList:
-                        if f.startswith("patch_") and f.endswith(".png"):
-                            patch_files.append(f)
-                    if patch_files:
-                        self.adapt.trees(patch_files, self.prefs.watchFolder)
-                except RuntimeError:
-                    pass
+                checkSettings()
+                fileList = self.watcher.poll(force=self.ingest.waiting())
+                if fileList is not None:
+                    folder = self.prefs.watchFolder
+                    files = {}
+                    for f in self.ingest.ready(fileList):
+                        files[f] = os.path.join(folder, f), self.ingest.age(f)
+                    self.decode(files)
+                self.receive()
+                self.applyDecoded()
+                self.adapt.refine(self.prefs.CRS)
+                if self.governor:
+                    tier = self.governor.decide()
+                    if tier:
+                        self.adapt.setRealism(tier)
 
         return {"PASS_THROUGH"}
 
+    def receive(self):
+        """Decodes the newest layers that came in over the socket"""
+        if self.server is None:
+            return
+        now = time.time()
+        for f, (path, arrived) in self.server.take().items():
+            if f in self.received:
+                # superseded before it could be decoded
+                self.server.discard(self.received[f][0])
+            self.received[f] = path, now - arrived
+        files = {}
+        for f in list(self.received):
+            if not self.decoder.busy(f):
+                files[f] = self.received.pop(f)
+        self.decode(files)
+
+    def decode(self, files):
+        """Starts decoding ready files on the worker pool.
+
+        files maps file names to their path and seconds since they arrived,
+        a file whose name is still decoding is skipped.
+
+        Only terrain jobs build mesh arrays. Water, trees and trails are
+        built against the terrain applied on the main thread, which may
+        change in the same tick, so their jobs only decode the file.
+        """
+        decoder = self.decoder
+        for f, (path, age) in files.items():
+            if decoder.busy(f):
+                continue
+            self.detected[f] = age
+            self.paths[f] = path
+            layer = layer_file(f)
+            if layer == terrainFile:
+                decoder.submit(f, prepare_terrain, path, *self.adapt.terrainParams())
+            elif layer == waterFile:
+                decoder.submit(f, read_grid, path)
+            elif layer in (viewFile, trailFile):
+                decoder.submit(f, read_lines, path)
+            elif is_patch(f):
+                decoder.submit(f, decode_patch, path)
+
+    def layerJob(self, layer):
+        """File of a layer, in either format, that is being decoded"""
+        for f in (layer, binary_name(layer)):
+            if self.decoder.busy(f):
+                return f
+        return None
+
+    def applyDecoded(self):
+        """Applies finished decodes on the main thread, terrain first"""
+        decoder = self.decoder
+        paths = self.paths
+        CRS = self.prefs.CRS
+        terrain = self.layerJob(terrainFile)
+        if terrain and decoder.done(terrain):
+            applied = self.apply(
+                [terrain], self.adapt.terrainChange, paths[terrain], CRS
+            )
+            if applied and self.prefs.batch_render:
+                render_views()
+        water = self.layerJob(waterFile)
+        if water and decoder.done(water):
+            self.apply([water], self.adapt.waterFill, paths[water], CRS)
+        view = self.layerJob(viewFile)
+        if view and decoder.done(view):
+            self.apply([view], self.adapt.camera_view, paths[view], CRS)
+        # trails and trees are placed on the terrain, wait for its update
+        if self.layerJob(terrainFile):
+            return
+        trail = self.layerJob(trailFile)
+        if trail and decoder.done(trail):
+            self.apply([trail], self.adapt.trails, paths[trail], CRS)
+        patch_files = [f for f in decoder.jobs if is_patch(f)]
+        if patch_files and all(decoder.done(f) for f in patch_files):
+            # full paths, patches may come from the watch folder or the socket
+            patch_paths = [paths[f] for f in patch_files]
+            folder = self.prefs.watchFolder
+            self.apply(patch_files, self.adapt.trees, patch_paths, folder, CRS)
+
+    def apply(self, names, handler, *args):
+        """Runs a layer handler with the decoded files, returns if it worked.
+
+        Files that fail are skipped until they change.
+        """
+        profiler = self.adapt.profiler
+        # decoding runs in parallel, the slowest file counts
+        timings = [self.decoder.timing(name) for name in names]
+        profiler.begin(
+            layer_name(names[0]),
+            names,
+            (
+                ("detect", max(self.detected.pop(n, 0) for n in names)),
+                ("queue", max(t[0] for t in timings)),
+                ("decode", max(t[1] for t in timings)),
+                ("wait", min(t[2] for t in timings)),
+            ),
+        )
+        try:
+            decoded = [self.decoder.result(name) for name in names]
+            handler(*args, decoded=decoded)
+            with profiler.stage("purge"):
+                purge_orphans()
+            with profiler.stage("ready"):
+                bpy.context.view_layer.update()
+        except Exception as e:
+            # a bad file must not end watch mode without cleaning up
+            profiler.cancel()
+            print("Could not process {}: {}".format(", ".join(names), e))
+            if not isinstance(e, (RuntimeError, OSError)):
+                traceback.print_exc()
+            for name in names:
+                if not self.receivedPath(name):
+                    self.ingest.failed(name)
+            return False
+        finally:
+            for name in names:
+                self.release(name)
+        record = profiler.end()
+        if self.governor:
+            self.governor.update(record["total"])
+        for name in names:
+            self.ingest.done(name)
+        for area in bpy.context.screen.areas:
+            if area.type == "VIEW_3D":
+                area.tag_redraw()
+        return True
+
+    def receivedPath(self, name):
+        """Whether the file being applied came over the socket"""
+        path = self.paths.get(name)
+        return bool(path and self.server and self.server.owns(path))
+
+    def release(self, name):
+        """Forgets the path of an applied file, removing received ones"""
+        if self.receivedPath(name):
+            self.server.discard(self.paths[name])
+        self.paths.pop(name, None)
+
     def execute(self, context):
         wm = context.window_manager
         wm.modal_handler_add(self)
@@ -616,19 +1300,111 @@ class ModalTimerOperator(bpy.types.Operator):
         self.adaptMode = None
         self.prefs = Prefs()
         self.adapt = Adapt()
-        self.adapt.realism = "High"
         for file in os.listdir(self.prefs.watchFolder):
             try:
                 os.remove(os.path.join(self.prefs.watchFolder, file))
             except:
                 print("Could not remove file")
-        self._timer = wm.event_timer_add(self.prefs.timer, window=context.window)
+        self.watcher = create_watcher(self.prefs.watchFolder, self.prefs.timer)
+        self.ingest = Ingest(self.prefs.watchFolder, self.prefs.settle, is_layer)
+        addSettingsListener(self.settingsChanged)
+        self.decoder = create_decoder(self.prefs.worker_processes)
+        self.detected = {}
+        # path of every file being decoded or applied
+        self.paths = {}
+        # socket messages waiting for an earlier version to be applied
+        self.received = {}
+        self.server = None
+        self.startServer(self.prefs.socket)
+        profiler.log_path = self.prefs.profile_log
+        profiler.meta = {
+            "version": ".".join(str(v) for v in bl_info["version"]),
+            "blender": bpy.app.version_string,
+            "host": platform.node(),
+        }
+        self.startGovernor(getSettings())
+        self._window = context.window
+        self._timer = wm.event_timer_add(self.watcher.tick, window=context.window)
 
         return {"RUNNING_MODAL"}
 
+    def startServer(self, address):
+        """Listens for layer messages when the settings name an address"""
+        if self.server is not None:
+            for path, age in self.received.values():
+                self.server.discard(path)
+            self.received.clear()
+            self.server.close()
+            self.server = None
+        if not address:
+            return
+        try:
+            self.server = LayerServer(address, is_layer, shared_folder())
+        except (OSError, AttributeError) as e:
+            print("Could not listen on {}: {}".format(address, e))
+
+    def startGovernor(self, settings):
+        """Sets the starting realism tier and measures viewport draws"""
+        tier = settings.get("realism", "High")
+        if tier not in TIERS:
+            tier = "High"
+        self._textureLimit = bpy.context.preferences.system.gl_texture_limit
+        self.adapt.setRealism(tier)
+        self.governor = None
+        self._draw = []
+        if not settings.get("governor", True):
+            return
+        self.governor = Governor(
+            tier,
+            fps=settings.get("target_fps", 60),
+            update=settings.get("target_update", 1.0),
+        )
+        space = bpy.types.SpaceView3D
+        self._draw = [space.draw_handler_add(self.drawn, (), "WINDOW", "PRE_VIEW")]
+
+    def drawn(self):
+        """Feeds the draws of every 3D viewport region to the governor"""
+        region = bpy.context.region
+        self.governor.draw(region.as_pointer() if region else None)
+
+    def settingsChanged(self, settings):
+        """Applies edited settings without restarting watch mode"""
+        old = self.prefs
+        prefs = self.prefs = Prefs(settings)
+        self.adapt.configure(settings)
+        if prefs.watchFolder != old.watchFolder or prefs.timer != old.timer:
+            self.watcher.close()
+            self.watcher = create_watcher(prefs.watchFolder, prefs.timer)
+            wm = bpy.context.window_manager
+            wm.event_timer_remove(self._timer)
+            self._timer = wm.event_timer_add(self.watcher.tick, window=self._window)
+            self._timer_count = 0
+        if prefs.watchFolder != old.watchFolder:
+            self.ingest = Ingest(prefs.watchFolder, prefs.settle, is_layer)
+        if prefs.socket != old.socket:
+            self.startServer(prefs.socket)
+        self.ingest.settle = prefs.settle
+        profiler.log_path = prefs.profile_log
+        if prefs.scale != old.scale:
+            rescale_assets(prefs.scale / old.scale)
+        for c, tree in prefs.trees.items():
+            if c not in old.trees or tree["model"] != old.trees[c]["model"]:
+                if not bpy.data.objects.get(trees_prefix + c):
+                    # not loaded yet, the first patch loads the new model
+                    continue
+                tree_names = load_objects_from_file(tree["model"], scale=prefs.scale)
+                create_vegetation(c, tree_object_name=tree_names[0])
+
     def cancel(self, context):
         wm = context.window_manager
         wm.event_timer_remove(self._timer)
+        removeSettingsListener(self.settingsChanged)
+        for handler in self._draw:
+            bpy.types.SpaceView3D.draw_handler_remove(handler, "WINDOW")
+        bpy.context.preferences.system.gl_texture_limit = self._textureLimit
+        self.watcher.close()
+        self.decoder.close()
+        self.startServer(None)
 
 
 # Panel
@@ -655,6 +1431,43 @@ class TL_PT_GUI(bpy.types.Panel):
         box.label(text="Camera options", icon="CAMERA_DATA")
         row = box.row(align=True)
         row.operator("tl.birdcam", text="Preset Bird views", icon="VIEW_CAMERA")
+        row = box.row(align=True)
+        row.operator("tl.renderviews", text="Render all views", icon="RENDER_STILL")
+        if renders.busy:
+            box.label(
+                text="Rendering {} views".format(
+                    len(renders.running) + len(renders.queue)
+                )
+            )
+
+        summary = profiler.summary()
+        if summary:
+            box = layout.box()
+            box.label(text="Update time (last / p50 / p95)", icon="TIME")
+            if "tl_realism" in context.scene:
+                row = box.row()
+                row.label(text="realism")
+                row.label(text=context.scene["tl_realism"])
+            for layer, (last, p50, p95) in summary.items():
+                row = box.row()
+                row.label(text=layer)
+                row.label(
+                    text="{:.0f} / {:.0f} / {:.0f} ms".format(
+                        last * 1000, p50 * 1000, p95 * 1000
+                    )
+                )
+
+        rss, counts = memory_report()
+        box = layout.box()
+        box.label(text="Memory", icon="MEMORY")
+        if rss is not None:
+            row = box.row()
+            row.label(text="RSS")
+            row.label(text="{:.0f} MB".format(rss))
+        for kind, count in counts.items():
+            row = box.row()
+            row.label(text=kind)
+            row.label(text=str(count))
 
         box = layout.box()
         box.label(text="Remove")
@@ -675,24 +1488,12 @@ class TL_OT_Assets(bpy.types.Operator):
 
     def execute(self, context):
         prefs = Prefs()
-        add_sun()
-        create_dynamic_camera()
-        create_bird_cameras()
-        create_terrain_material(
-            name="terrain_material",
-            texture_path=prefs.terrain_texture_path,
-            sides=False,
-        )
-        create_terrain_material(
-            name="terrain_sides_material",
-            texture_path=prefs.terrain_sides_texture_path,
-            sides=True,
-        )
-        create_trail_material(
-            name="trail_material", texture_path=prefs.trail_texture_path
-        )
-        create_water_material(name="water_material")
-        create_world(name="TL_world", texture_path=prefs.world_texture_path)
+        template = os.path.join(prefs.folder, templateFile.format(asset_key(prefs)))
+        remove_object("Cube")
+        if os.path.exists(template):
+            append_template(template)
+        else:
+            build_assets(prefs, template)
         bpy.context.scene.world = bpy.data.worlds.get("TL_world")
         bpy.context.space_data.shading.type = "RENDERED"
         bpy.context.space_data.overlay.show_floor = False
@@ -705,16 +1506,68 @@ class TL_OT_Assets(bpy.types.Operator):
         bpy.context.space_data.overlay.show_outline_selected = False
         bpy.context.space_data.overlay.show_extras = False
         bpy.context.space_data.overlay.show_object_origins = False
-
-        remove_object("Cube")
-        load_objects_from_file(prefs.profile, scale=prefs.scale)
-        for each in prefs.trees:
-            tree_names = load_objects_from_file(prefs.trees[each]["model"], scale=prefs.scale)
-            create_particle_system(each, particle_object_name=tree_names[0])
+        # tree models are loaded by Adapt.trees when their patch arrives
 
         return {"FINISHED"}
 
 
+def asset_key(prefs):
+    """Hash of everything the asset template is built from"""
+    digest = hashlib.sha1()
+    digest.update(
+        json.dumps([bl_info["version"], prefs.scale, asset_materials]).encode()
+    )
+    for path in (
+        prefs.terrain_texture_path,
+        prefs.terrain_sides_texture_path,
+        prefs.trail_texture_path,
+        prefs.world_texture_path,
+        prefs.profile,
+    ):
+        digest.update(path.encode())
+        file_digest(path, digest)
+    return digest.hexdigest()[:16]
+
+
+def build_assets(prefs, template=None):
+    """Creates materials, world, sun, cameras and the trail profile.
+
+    With a template path the result is saved there for the next launch.
+    """
+    before = set(bpy.data.objects)
+    add_sun()
+    create_dynamic_camera()
+    create_bird_cameras()
+    create_terrain_material(
+        name="terrain_material",
+        texture_path=prefs.terrain_texture_path,
+        sides=False,
+    )
+    create_terrain_material(
+        name="terrain_sides_material",
+        texture_path=prefs.terrain_sides_texture_path,
+        sides=True,
+    )
+    create_trail_material(name="trail_material", texture_path=prefs.trail_texture_path)
+    create_water_material(name="water_material")
+    create_fast_water_material(name="fast_water_material")
+    create_world(name="TL_world", texture_path=prefs.world_texture_path)
+    load_objects_from_file(prefs.profile, scale=prefs.scale)
+    if template is None:
+        return
+    for old in glob.glob(os.path.join(prefs.folder, templateFile.format("*"))):
+        os.remove(old)
+    try:
+        write_template(
+            template,
+            [obj for obj in bpy.data.objects if obj not in before],
+            [bpy.data.materials[name] for name in asset_materials],
+            [bpy.data.worlds["TL_world"]],
+        )
+    except OSError as e:
+        print("Could not save asset template: {}".format(e))
+
+
 class BirdCam(bpy.types.Operator):
     bl_idname = "tl.birdcam"
     bl_label = "Toogle Bird views"
@@ -726,6 +1579,15 @@ class BirdCam(bpy.types.Operator):
         return {"FINISHED"}
 
 
+class RenderViews(bpy.types.Operator):
+    bl_idname = "tl.renderviews"
+    bl_label = "Render all camera views in the background"
+
+    def execute(self, context):
+        render_views()
+        return {"FINISHED"}
+
+
 class ClearOperators(bpy.types.Operator):
     bl_idname = "objects.operator"
     bl_label = "Object Operators"
@@ -733,10 +1595,7 @@ class ClearOperators(bpy.types.Operator):
 
     def execute(self, context):
         if self.button == "TREES":
-            terrain = bpy.data.objects.get("terrain")
-            if terrain:
-                while terrain.modifiers:
-                    terrain.modifiers.remove(terrain.modifiers[-1])
+            clear_vegetation()
         elif self.button == "TRAIL":
             remove_object("trail")
 
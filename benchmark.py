@@ -0,0 +1,423 @@
+"""Replays synthetic layer updates through the Adapt handlers.
+
+Run in background Blender:
+
+    blender -b --python benchmark.py -- --sizes 256 1024 4096 --out new.json
+
+and compare two runs with plain Python:
+
+    python benchmark.py --compare base.json new.json
+
+--binary writes the layers in the raw binary format instead of GeoTIFF,
+shapefiles and PNG.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import zlib
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXTENT = 500.0
+ORIGIN = (630000.0, 215500.0)
+CRS = "EPSG:3358"
+LAYERS = ("terrain", "water", "vantage", "trail", "trees")
+
+
+def write_geotiff(path, data, origin, pixel_size, nodata=-9999.0):
+    """Uncompressed float32 GeoTIFF, one strip per row"""
+    data = np.where(np.isnan(data), nodata, data).astype("<f4")
+    rows, cols = data.shape
+    entries = [
+        (256, 4, [cols]),
+        (257, 4, [rows]),
+        (258, 3, [32]),
+        (259, 3, [1]),
+        (262, 3, [1]),
+        (273, 4, None),
+        (277, 3, [1]),
+        (278, 4, [1]),
+        (279, 4, [cols * 4] * rows),
+        (339, 3, [3]),
+        (33550, 12, [pixel_size, pixel_size, 0.0]),
+        (33922, 12, [0.0, 0.0, 0.0, origin[0], origin[1], 0.0]),
+        (34735, 3, [1, 1, 0, 1, 1025, 0, 1, 1]),
+        (42113, 2, "{:g}".format(nodata)),
+    ]
+    formats = {2: "s", 3: "H", 4: "I", 12: "d"}
+    ifd_size = 2 + 12 * len(entries) + 4
+    extra_offset = 8 + ifd_size
+    blobs = []
+    for tag, kind, values in entries:
+        if kind == 2:
+            blobs.append(values.encode() + b"\x00")
+        elif values is None:
+            blobs.append(b"\x00" * 4 * rows)
+        else:
+            blobs.append(struct.pack("<" + formats[kind] * len(values), *values))
+    data_offset = extra_offset + sum(len(b) for b in blobs if len(b) > 4)
+    ifd = struct.pack("<H", len(entries))
+    extra = b""
+    for (tag, kind, values), blob in zip(entries, blobs):
+        if values is None:
+            values = [data_offset + r * cols * 4 for r in range(rows)]
+            blob = struct.pack("<%dI" % rows, *values)
+        count = len(blob) if kind == 2 else len(values)
+        if len(blob) <= 4:
+            ifd += struct.pack("<HHI", tag, kind, count) + blob.ljust(4, b"\x00")
+        else:
+            offset = extra_offset + len(extra)
+            ifd += struct.pack("<HHII", tag, kind, count, offset)
+            extra += blob
+    ifd += struct.pack("<I", 0)
+    with open(path, "wb") as f:
+        f.write(b"II" + struct.pack("<HI", 42, 8) + ifd + extra + data.tobytes())
+
+
+def write_png(path, rgb):
+    """8 bit RGB PNG without scanline filters"""
+
+    def chunk(kind, content):
+        crc = zlib.crc32(kind + content) & 0xFFFFFFFF
+        return struct.pack(">I", len(content)) + kind + content + struct.pack(">I", crc)
+
+    rows, cols = rgb.shape[:2]
+    lines = np.zeros((rows, cols * 3 + 1), dtype=np.uint8)
+    lines[:, 1:] = rgb.reshape(rows, -1)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", cols, rows, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(lines.tobytes(), 1)))
+        f.write(chunk(b"IEND", b""))
+
+
+def write_shapefile(path, lines):
+    """PolyLine shapefile with its .shx index and a minimal .dbf"""
+    records = []
+    for line in lines:
+        line = np.asarray(line, dtype="<f8")
+        box = line.min(axis=0).tolist() + line.max(axis=0).tolist()
+        content = struct.pack(
+            "<i4d2ii", 3, box[0], box[1], box[2], box[3], 1, len(line), 0
+        )
+        records.append(content + line.tobytes())
+    everything = np.concatenate([np.asarray(l) for l in lines])
+    box = everything.min(axis=0).tolist() + everything.max(axis=0).tolist()
+
+    def header(length):
+        return (
+            struct.pack(">7i", 9994, 0, 0, 0, 0, 0, length // 2)
+            + struct.pack("<2i", 1000, 3)
+            + struct.pack("<8d", box[0], box[1], box[2], box[3], 0, 0, 0, 0)
+        )
+
+    shp = b""
+    shx = b""
+    offset = 100
+    for i, content in enumerate(records):
+        shx += struct.pack(">2i", offset // 2, len(content) // 2)
+        shp += struct.pack(">2i", i + 1, len(content) // 2) + content
+        offset += 8 + len(content)
+    stem = os.path.splitext(path)[0]
+    with open(stem + ".shx", "wb") as f:
+        f.write(header(100 + len(shx)) + shx)
+    field = b"id".ljust(11, b"\x00") + b"N" + b"\x00" * 4 + bytes([8, 0]) + b"\x00" * 14
+    dbf = struct.pack("<B3BIHH20x", 3, 95, 1, 1, len(lines), 65, 9) + field + b"\r"
+    for i in range(len(lines)):
+        dbf += b" " + str(i).rjust(8).encode()
+    with open(stem + ".dbf", "wb") as f:
+        f.write(dbf + b"\x1a")
+    # written last, the ingest stage waits for the sidecars through it
+    with open(path, "wb") as f:
+        f.write(header(100 + len(shp)) + shp)
+
+
+def synthetic_scene(size, seed):
+    """Terrain, water surface, tree patches and lines for one update"""
+    rng = np.random.RandomState(seed)
+    pixel = EXTENT / size
+    y, x = np.mgrid[0:size, 0:size] / size
+    terrain = 20 * np.sin(3 * x + seed) * np.cos(2 * y) + 10 * x
+    for cx, cy, r, h in rng.uniform([0, 0, 0.05, -30], [1, 1, 0.3, 30], (6, 4)):
+        terrain += h * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / r**2)
+    level = np.percentile(terrain, 20)
+    water = np.where(terrain < level, level, np.nan)
+    patches = {}
+    for c in range(1, 5):
+        cx, cy = rng.uniform(0, 1, 2)
+        mask = (x - cx) ** 2 + (y - cy) ** 2 < rng.uniform(0.01, 0.05)
+        rgb = np.zeros((size, size, 3), dtype=np.uint8)
+        rgb[mask] = 255
+        patches["patch_class{}.png".format(c)] = rgb
+    t = np.linspace(0, 1, 200)
+    trail = np.column_stack(
+        [
+            ORIGIN[0] + EXTENT * (0.1 + 0.8 * t),
+            ORIGIN[1] - EXTENT * (0.5 + 0.3 * np.sin(6 * t + seed)),
+        ]
+    )
+    vantage = np.array(
+        [
+            [ORIGIN[0] + EXTENT * 0.2, ORIGIN[1] - EXTENT * 0.2],
+            [ORIGIN[0] + EXTENT * 0.6, ORIGIN[1] - EXTENT * 0.6],
+        ]
+    )
+    return pixel, terrain.astype(np.float32), water, patches, trail, vantage
+
+
+def memory():
+    """Current and peak resident set size in MB from /proc"""
+    values = {}
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(("VmRSS", "VmHWM")):
+                    key, value = line.split(":")
+                    values[key] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+def reset_peak_memory():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def setup_scene(M):
+    """Materials, cameras and tree instancers TL_OT_Assets would create"""
+    import bpy
+
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    M.add_sun()
+    M.create_dynamic_camera()
+    M.create_bird_cameras()
+    textures = os.path.join(HERE, "textures")
+    M.create_terrain_material(
+        "terrain_material", os.path.join(textures, "grass_final.jpg"), sides=False
+    )
+    M.create_terrain_material(
+        "terrain_sides_material", os.path.join(textures, "dirt.jpg"), sides=True
+    )
+    M.create_trail_material("trail_material", os.path.join(textures, "boardwalk.png"))
+    M.create_water_material("water_material")
+    M.load_objects_from_file(os.path.join(HERE, "assets", "T_profile.blend"))
+    for c in range(1, 5):
+        # simple stand-ins for the tree models
+        bpy.ops.mesh.primitive_cone_add(radius1=1, depth=4)
+        tree = bpy.context.object
+        tree.name = "tree_class{}".format(c)
+        tree.hide_set(True)
+        M.create_vegetation("class{}".format(c), tree.name)
+
+
+def write_binary(B, folder, pixel, terrain, water, patches, trail, vantage):
+    """Writes the layers of one update as binary layers, returns their paths"""
+    georef = B.GeoRef((ORIGIN[0], ORIGIN[1]), (pixel, -pixel), terrain.shape)
+    paths = {}
+    for layer, data in (("terrain", terrain), ("water", water)):
+        paths[layer] = os.path.join(folder, layer + B.SUFFIX)
+        B.write_layer(paths[layer], data.astype("<f4"), georef)
+    for layer, line in (("vantage", vantage), ("trail", trail)):
+        paths[layer] = os.path.join(folder, layer + B.SUFFIX)
+        co = np.column_stack([line, np.zeros(len(line))])
+        B.write_layer(paths[layer], co, parts=[len(co)])
+    names = []
+    for patch, rgb in patches.items():
+        rgba = np.concatenate([rgb, np.full(rgb.shape[:2] + (1,), 255, np.uint8)], 2)
+        names.append(B.binary_name(patch))
+        B.write_layer(os.path.join(folder, names[-1]), rgba)
+    return paths, names
+
+
+def run(sizes, repeat, out, binary=False):
+    import bpy
+
+    name = os.path.basename(HERE)
+    sys.path.insert(0, os.path.dirname(HERE))
+    M = importlib.import_module(name + ".Modeling3D")
+    B = importlib.import_module(name + ".binary")
+    profiler = importlib.import_module(name + ".profiling").profiler
+    try:
+        import addon_utils
+
+        addon_utils.enable("BlenderGIS")
+    except Exception:
+        pass
+
+    results = {}
+    folder = tempfile.mkdtemp(prefix="tl_benchmark_")
+    try:
+        for size in sizes:
+            setup_scene(M)
+            adapt = M.Adapt()
+            runs = {layer: [] for layer in LAYERS}
+            for i in range(repeat):
+                pixel, terrain, water, patches, trail, vantage = synthetic_scene(
+                    size, i
+                )
+                if binary:
+                    paths, patch_files = write_binary(
+                        B, folder, pixel, terrain, water, patches, trail, vantage
+                    )
+                else:
+                    paths = {
+                        "terrain": os.path.join(folder, M.terrainFile),
+                        "water": os.path.join(folder, M.waterFile),
+                        "vantage": os.path.join(folder, M.viewFile),
+                        "trail": os.path.join(folder, M.trailFile),
+                    }
+                    write_geotiff(paths["terrain"], terrain, ORIGIN, pixel)
+                    write_geotiff(paths["water"], water, ORIGIN, pixel)
+                    write_shapefile(paths["vantage"], [vantage])
+                    write_shapefile(paths["trail"], [trail])
+                    patch_files = list(patches)
+                    for patch, rgb in patches.items():
+                        write_png(os.path.join(folder, patch), rgb)
+                calls = (
+                    ("terrain", adapt.terrainChange, (paths["terrain"], CRS)),
+                    ("water", adapt.waterFill, (paths["water"], CRS)),
+                    ("vantage", adapt.camera_view, (paths["vantage"], CRS)),
+                    ("trail", adapt.trails, (paths["trail"], CRS)),
+                    ("trees", adapt.trees, (sorted(patch_files), folder, CRS)),
+                )
+                for layer, handler, args in calls:
+                    reset_peak_memory()
+                    profiler.begin(layer, [layer])
+                    try:
+                        handler(*args)
+                        with profiler.stage("purge"):
+                            M.purge_orphans()
+                        with profiler.stage("ready"):
+                            bpy.context.view_layer.update()
+                    except Exception as e:
+                        profiler.cancel()
+                        runs[layer].append({"error": str(e)})
+                        continue
+                    record = profiler.end()
+                    rss, peak = memory()
+                    runs[layer].append(
+                        {
+                            "total": record["total"],
+                            "stages": dict(record["stages"]),
+                            "rss_mb": rss,
+                            "peak_rss_mb": peak,
+                        }
+                    )
+                for f in os.listdir(folder):
+                    os.remove(os.path.join(folder, f))
+            results[str(size)] = {layer: summarize(r) for layer, r in runs.items()}
+            print_results({str(size): results[str(size)]})
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "blender": bpy.app.version_string,
+            "repeat": repeat,
+            "cpu_count": os.cpu_count(),
+            "binary": binary,
+        },
+        "results": results,
+    }
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent="\t")
+    return report
+
+
+def summarize(runs):
+    ok = [r for r in runs if "error" not in r]
+    if not ok:
+        return {"error": runs[0]["error"] if runs else "not run"}
+    totals = [r["total"] for r in ok]
+    stages = {}
+    for r in ok:
+        for stage, seconds in r["stages"].items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        "first": totals[0],
+        "median": float(np.median(totals)),
+        "p95": float(np.percentile(totals, 95)),
+        "stages": {k: float(np.median(v)) for k, v in stages.items()},
+        "peak_rss_mb": max(r["peak_rss_mb"] or 0 for r in ok),
+        "errors": len(runs) - len(ok),
+    }
+
+
+def print_results(results):
+    for size, layers in results.items():
+        for layer, r in layers.items():
+            if "error" in r:
+                print("{:>5} {:<8} error: {}".format(size, layer, r["error"]))
+                continue
+            print(
+                "{:>5} {:<8} first {:8.1f} ms  median {:8.1f} ms  p95 {:8.1f} ms"
+                "  peak {:7.0f} MB".format(
+                    size,
+                    layer,
+                    r["first"] * 1000,
+                    r["median"] * 1000,
+                    r["p95"] * 1000,
+                    r["peak_rss_mb"],
+                )
+            )
+
+
+def compare(base, new):
+    """Prints the median change of every layer between two reports"""
+    with open(base) as f:
+        base = json.load(f)["results"]
+    with open(new) as f:
+        new = json.load(f)["results"]
+    print(
+        "{:>5} {:<8} {:>12} {:>12} {:>8}".format(
+            "size", "layer", "base", "new", "change"
+        )
+    )
+    for size in base:
+        for layer, a in base[size].items():
+            b = new.get(size, {}).get(layer)
+            if not b or "median" not in a or "median" not in b:
+                continue
+            change = (b["median"] - a["median"]) / a["median"] * 100
+            print(
+                "{:>5} {:<8} {:>9.1f} ms {:>9.1f} ms {:>+7.1f}%".format(
+                    size, layer, a["median"] * 1000, b["median"] * 1000, change
+                )
+            )
+
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[256, 512, 1024, 2048, 4096]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", help="JSON report to write")
+    parser.add_argument(
+        "--binary", action="store_true", help="write binary layers instead"
+    )
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two reports"
+    )
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args.sizes, args.repeat, args.out, args.binary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Raw binary layers, a cheaper alternative to GeoTIFF and shapefiles.
+
+A layer file is the magic bytes, the little endian length of a JSON header,
+the header padded with spaces so that the payload starts 16 byte aligned,
+and the payload as one contiguous C order array. The header holds
+
+    kind        "raster" or "lines"
+    dtype       numpy dtype string of the payload, "<f4", "<f8" or "|u1"
+    shape       payload shape, rows first for rasters, (n, 3) for lines,
+                (rows, cols, 4) for RGBA images like tree patches
+    origin      raster upper left corner, optional for images
+    pixel_size  raster pixel width and (negative) height
+    parts       vertex count of every line, summing up to n
+
+Missing raster cells are NaN, image rows go top row first like in a PNG.
+Files are memory mapped, not read, so writers must write them under a
+temporary name and rename them into place instead of overwriting. On
+Windows the payload is copied instead, a mapped file cannot be removed.
+"""
+
+import json
+import struct
+import sys
+
+import numpy as np
+
+from .raster import GeoRef, read_geotiff, read_png
+from .vector import read_shapefile
+
+MAGIC = b"TLB1"
+SUFFIX = ".tlb"
+DTYPES = ("<f4", "<f8", "|u1")
+ALIGN = 16
+
+
+def binary_name(name):
+    """Binary layer name standing in for a GeoTIFF, PNG or shapefile name"""
+    return name.rsplit(".", 1)[0] + SUFFIX
+
+
+def is_binary(path):
+    return path.endswith(SUFFIX)
+
+
+def read_header(path):
+    """Parsed header and payload offset of a binary layer"""
+    with open(path, "rb") as f:
+        start = f.read(len(MAGIC) + 4)
+        if len(start) < len(MAGIC) + 4 or start[: len(MAGIC)] != MAGIC:
+            raise RuntimeError("{} is not a binary layer".format(path))
+        (length,) = struct.unpack("<I", start[len(MAGIC) :])
+        try:
+            header = json.loads(f.read(length).decode("utf-8"))
+        except ValueError as e:
+            raise RuntimeError("Bad header in {}: {}".format(path, e))
+    _check_header(header, path)
+    return header, len(start) + length
+
+
+def _numbers(value, count=None, kind=(int, float)):
+    return (
+        isinstance(value, list)
+        and (count is None or len(value) == count)
+        and all(isinstance(v, kind) and not isinstance(v, bool) for v in value)
+    )
+
+
+def _check_header(header, path):
+    """Raises RuntimeError unless the header has valid fields of its kind"""
+    if not isinstance(header, dict):
+        raise RuntimeError("Bad header in {}: not an object".format(path))
+    if header.get("dtype") not in DTYPES:
+        raise RuntimeError("Unsupported dtype in {}".format(path))
+    shape = header.get("shape")
+    if not _numbers(shape, kind=int) or not shape or min(shape) < 0:
+        raise RuntimeError("Bad shape in {}".format(path))
+    kind = header.get("kind")
+    if kind == "raster":
+        if "origin" in header or "pixel_size" in header:
+            if not (
+                _numbers(header.get("origin"), 2)
+                and _numbers(header.get("pixel_size"), 2)
+            ):
+                raise RuntimeError("Bad georeference in {}".format(path))
+    elif kind == "lines":
+        parts = header.get("parts")
+        if not _numbers(parts, kind=int) or min(parts, default=0) < 0:
+            raise RuntimeError("Bad parts in {}".format(path))
+    else:
+        raise RuntimeError("Unknown layer kind in {}".format(path))
+
+
+def read_layer(path):
+    """Maps a binary layer, returns its header and read only payload"""
+    header, offset = read_header(path)
+    shape = tuple(header["shape"])
+    try:
+        data = np.memmap(
+            path, dtype=header["dtype"], mode="r", offset=offset, shape=shape
+        )
+    except (ValueError, OverflowError) as e:
+        raise RuntimeError("Could not map {}: {}".format(path, e))
+    if sys.platform == "win32":
+        # Windows cannot remove a mapped file, which the handlers do once
+        # the layer is applied, so the payload is copied and unmapped
+        data = np.array(data)
+    return header, data
+
+
+def read_binary_raster(path):
+    """Same as read_geotiff for a binary raster layer, without copying"""
+    header, data = read_layer(path)
+    if header["kind"] != "raster":
+        raise RuntimeError("{} is not a raster layer".format(path))
+    georef = None
+    if "origin" in header:
+        georef = GeoRef(
+            tuple(header["origin"]),
+            tuple(header["pixel_size"]),
+            data.shape[:2],
+        )
+    return data, georef
+
+
+def read_binary_lines(path):
+    """Same as read_shapefile for a binary lines layer"""
+    header, data = read_layer(path)
+    if header["kind"] != "lines" or data.ndim != 2 or data.shape[1] != 3:
+        raise RuntimeError("{} is not a lines layer".format(path))
+    parts = header["parts"]
+    if sum(parts) != len(data):
+        raise RuntimeError("Parts do not match the vertices of {}".format(path))
+    ends = np.cumsum(parts)
+    return [data[end - n : end] for n, end in zip(parts, ends)]
+
+
+def read_grid(path):
+    """float32 raster and georef of a GeoTIFF or binary layer"""
+    if not is_binary(path):
+        return read_geotiff(path)
+    data, georef = read_binary_raster(path)
+    if georef is None or data.ndim != 2:
+        raise RuntimeError("{} is not a georeferenced grid".format(path))
+    if data.dtype != np.float32:
+        data = data.astype(np.float32)
+    return data, georef
+
+
+def read_lines(path):
+    """Line parts of a shapefile or binary layer"""
+    if is_binary(path):
+        return read_binary_lines(path)
+    return read_shapefile(path)
+
+
+def read_image(path):
+    """(rows, cols, 4) uint8 RGBA, top row first, of a PNG or binary layer"""
+    if not is_binary(path):
+        return read_png(path)
+    data = read_binary_raster(path)[0]
+    if data.dtype != np.uint8:
+        raise RuntimeError("{} is not an 8 bit image".format(path))
+    if data.ndim != 3 or data.shape[2] != 4:
+        raise RuntimeError("{} is not an RGBA image".format(path))
+    return data
+
+
+def write_layer(path, data, georef=None, parts=None):
+    """Writes a binary raster, or lines when parts are given"""
+    data = np.ascontiguousarray(data)
+    header = {"dtype": data.dtype.str, "shape": list(data.shape)}
+    if parts is None:
+        header["kind"] = "raster"
+        if georef is not None:
+            header["origin"] = list(georef.origin)
+            header["pixel_size"] = list(georef.pixel_size)
+    else:
+        header["kind"] = "lines"
+        header["parts"] = [int(n) for n in parts]
+    if header["dtype"] not in DTYPES:
+        raise ValueError("Unsupported dtype {}".format(data.dtype))
+    text = json.dumps(header).encode("utf-8")
+    text += b" " * (-(len(MAGIC) + 4 + len(text)) % ALIGN)
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(text)) + text)
+        f.write(data.tobytes())
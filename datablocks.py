@@ -0,0 +1,92 @@
+from collections import OrderedDict
+
+import bpy
+
+# datablocks left behind by layer updates, removed once nothing uses them
+PURGED = ("meshes", "curves")
+# datablock types counted in the memory report
+REPORTED = ("objects", "meshes", "curves", "materials", "images", "textures")
+
+
+def remove_object(object_name):
+    """Removes an object and its data when no other object uses it"""
+    obj = bpy.data.objects.get(object_name)
+    if obj is None:
+        return
+    data = obj.data
+    bpy.data.objects.remove(obj)
+    if data is not None and data.users == 0:
+        bpy.data.batch_remove([data])
+
+
+def remove_hierarchy(object_name):
+    """Removes an object together with its children"""
+    obj = bpy.data.objects.get(object_name)
+    if obj is None:
+        return
+    for child in list(obj.children):
+        remove_hierarchy(child.name)
+    remove_object(object_name)
+
+
+def purge_orphans(kinds=PURGED):
+    """Removes datablocks without users, returns how many were removed"""
+    orphans = []
+    for kind in kinds:
+        for block in getattr(bpy.data, kind):
+            if block.users == 0 and not block.use_fake_user:
+                orphans.append(block)
+    if orphans:
+        bpy.data.batch_remove(orphans)
+    return len(orphans)
+
+
+def process_memory():
+    """Resident set size of Blender in MB, None where /proc is missing"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS"):
+                    return int(line.split(":")[1].split()[0]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def memory_report():
+    """Process memory and the number of datablocks of every reported type"""
+    counts = OrderedDict()
+    for kind in REPORTED:
+        counts[kind] = len(getattr(bpy.data, kind))
+    return process_memory(), counts
+
+
+def file_digest(path, digest):
+    """Feeds the contents of a file into a hashlib digest"""
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+
+
+def write_template(path, objects, materials, worlds):
+    """Saves datablocks to a .blend that append_template loads in one step"""
+    hidden = [obj.name for obj in objects if obj.hide_get()]
+    holder = worlds[0] if worlds else materials[0]
+    holder["tl_hidden"] = "\n".join(hidden)
+    bpy.data.libraries.write(
+        path, set(objects) | set(materials) | set(worlds), fake_user=True
+    )
+
+
+def append_template(path):
+    """Appends a template into the scene, hiding what was hidden when saved"""
+    with bpy.data.libraries.load(path, link=False) as (src, dst):
+        dst.objects = src.objects
+        dst.materials = src.materials
+        dst.worlds = src.worlds
+    hidden = set()
+    for block in list(dst.materials) + list(dst.worlds):
+        hidden.update(block.get("tl_hidden", "").split("\n"))
+    for obj in dst.objects:
+        bpy.context.scene.collection.objects.link(obj)
+        obj.hide_set(obj.name in hidden)
@@ -0,0 +1,271 @@
+"""Raster cells to mesh layouts, independent of Blender data."""
+
+import numpy as np
+
+
+class GridLayout:
+    """Which raster cells become mesh vertices and how they connect.
+
+    Vertex heights are gathered from cell i0, or interpolated between i0
+    and i1 with weight w for vertices stitched to a coarser neighbour.
+    """
+
+    def __init__(self, key, rows, cols, faces, i0, i1=None, w=None):
+        self.key = key
+        self.rows = rows
+        self.cols = cols
+        self.faces = faces
+        self.i0 = i0
+        self.i1 = i1
+        self.w = w
+
+    def heights(self, data):
+        flat = data.ravel()
+        z = flat[self.i0]
+        if self.w is not None:
+            z = z * (1 - self.w) + flat[self.i1] * self.w
+        return z.astype(np.float32)
+
+    def arrays(self, data, georef, origin):
+        """Vertex coordinates and per vertex uvs"""
+        x0, y0 = georef.origin
+        dx, dy = georef.pixel_size
+        rows, cols = georef.shape
+        co = np.empty((len(self.i0), 3), dtype=np.float32)
+        co[:, 0] = x0 + (self.cols + 0.5) * dx - origin[0]
+        co[:, 1] = y0 + (self.rows + 0.5) * dy - origin[1]
+        co[:, 2] = self.heights(data)
+        uv = np.empty((len(self.i0), 2), dtype=np.float32)
+        uv[:, 0] = (self.cols + 0.5) / cols
+        uv[:, 1] = 1 - (self.rows + 0.5) / rows
+        return co, uv
+
+
+def quads(nrows, ncols, start=0):
+    """Faces of a vertex grid, anticlockwise from the top right so they face up"""
+    idx = np.arange(start, start + nrows * ncols, dtype=np.int32)
+    idx = idx.reshape(nrows, ncols)
+    return np.stack(
+        [idx[:-1, 1:], idx[:-1, :-1], idx[1:, :-1], idx[1:, 1:]], axis=-1
+    ).reshape(-1, 4)
+
+
+def uniform_layout(shape, step=2):
+    """Every step-th cell of every step-th row, as importgis does"""
+    rows, cols = shape
+    r, c = np.meshgrid(
+        np.arange(0, rows, step), np.arange(0, cols, step), indexing="ij"
+    )
+    faces = quads(*r.shape)
+    r = r.ravel()
+    c = c.ravel()
+    return GridLayout(("grid", step), r, c, faces, r * cols + c)
+
+
+def tile_layouts(shape, step=2, tile=256):
+    """Uniform layouts of square tiles of about tile cells covering a grid.
+
+    Neighbouring tiles share their edge vertices so that the surface stays
+    closed. Returns (row, col) -> (layout, samples), samples being the
+    slices of the step-th rows and columns a tile reads.
+    """
+    rows, cols = shape
+    r = np.arange(0, rows, step)
+    c = np.arange(0, cols, step)
+    n = max(1, tile // step)
+    tiles = {}
+    for i, r0 in enumerate(range(0, max(len(r) - 1, 1), n)):
+        for j, c0 in enumerate(range(0, max(len(c) - 1, 1), n)):
+            samples = slice(r0, r0 + n + 1), slice(c0, c0 + n + 1)
+            rr, cc = np.meshgrid(r[samples[0]], c[samples[1]], indexing="ij")
+            faces = quads(*rr.shape)
+            rr = rr.ravel()
+            cc = cc.ravel()
+            key = ("tile", step, tile, i, j)
+            tiles[i, j] = GridLayout(key, rr, cc, faces, rr * cols + cc), samples
+    return tiles
+
+
+def edge_mask(layout, shape, step=2):
+    """Vertices of a layout on the boundary of the whole grid"""
+    last_row = (shape[0] - 1) // step * step
+    last_col = (shape[1] - 1) // step * step
+    return (
+        (layout.rows == 0)
+        | (layout.rows == last_row)
+        | (layout.cols == 0)
+        | (layout.cols == last_col)
+    )
+
+
+def changed_cells(before, after, tolerance=0.01):
+    """Cells whose height moved more than tolerance or became NaN or not"""
+    with np.errstate(invalid="ignore"):
+        moved = np.abs(after - before) > tolerance
+    return moved | (np.isnan(before) != np.isnan(after))
+
+
+def _samples(start, end, step):
+    return np.unique(np.r_[np.arange(start, end, step), end])
+
+
+def _stitch(positions, coarse, line, cols, along_rows):
+    """Gather indices and weights putting fine edge vertices on a coarse edge"""
+    k = np.clip(np.searchsorted(coarse, positions, side="right") - 1, 0, None)
+    a = coarse[k]
+    b = coarse[np.minimum(k + 1, len(coarse) - 1)]
+    w = np.where(b > a, (positions - a) / np.maximum(b - a, 1), 0)
+    if along_rows:
+        return line * cols + a, line * cols + b, w
+    return a * cols + line, b * cols + line, w
+
+
+def lod_layout(data, georef, origin, eye, step=2, levels=3, near=None, block=64):
+    """Finer blocks of cells close to the eye, coarser ones further away.
+
+    A block at distance d uses step * 2**level cells with level growing by
+    one every time d doubles past near. The eye height counts above the
+    terrain under it, or above the lowest cell when it is off the terrain.
+    Edges of finer blocks are stitched onto coarser neighbours so that the
+    surface has no cracks.
+    """
+    rows, cols = georef.shape
+    x0, y0 = georef.origin
+    dx, dy = georef.pixel_size
+    if near is None:
+        near = max(abs(dx) * cols, abs(dy) * rows) / 16
+    unit = step * 2**levels
+    size = unit * max(1, block // unit)
+    row_starts = np.arange(0, rows - 1, size)
+    col_starts = np.arange(0, cols - 1, size)
+    row_ends = np.minimum(row_starts + size, rows - 1)
+    col_ends = np.minimum(col_starts + size, cols - 1)
+
+    ground = interpolate_heights(data, georef, eye[0] + origin[0], eye[1] + origin[1])
+    if not np.isfinite(ground):
+        ground = np.nanmin(data) if np.isfinite(data).any() else 0
+    height = max(eye[2] - ground, 0)
+
+    # block centers in scene coordinates
+    cy = y0 + ((row_starts + row_ends) / 2 + 0.5) * dy - origin[1]
+    cx = x0 + ((col_starts + col_ends) / 2 + 0.5) * dx - origin[0]
+    dist = np.sqrt(
+        (cx[np.newaxis, :] - eye[0]) ** 2
+        + (cy[:, np.newaxis] - eye[1]) ** 2
+        + height**2
+    )
+    level = np.floor(np.log2(np.maximum(dist, near) / near)).astype(int)
+    level = np.clip(level, 0, levels)
+
+    all_rows, all_cols, all_faces, all_i0, all_i1, all_w = [], [], [], [], [], []
+    count = 0
+    for bi, (r0, r1) in enumerate(zip(row_starts, row_ends)):
+        for bj, (c0, c1) in enumerate(zip(col_starts, col_ends)):
+            s = step * 2 ** level[bi, bj]
+            rs = _samples(r0, r1, s)
+            cs = _samples(c0, c1, s)
+            r, c = np.meshgrid(rs, cs, indexing="ij")
+            i0 = r * cols + c
+            i1 = i0.copy()
+            w = np.zeros(r.shape)
+            neighbours = (
+                (bi - 1, bj, 0, True),
+                (bi + 1, bj, -1, True),
+                (bi, bj - 1, 0, False),
+                (bi, bj + 1, -1, False),
+            )
+            for ni, nj, edge, along_rows in neighbours:
+                if not (0 <= ni < len(row_starts) and 0 <= nj < len(col_starts)):
+                    continue
+                if level[ni, nj] <= level[bi, bj]:
+                    continue
+                ns = step * 2 ** level[ni, nj]
+                if along_rows:
+                    coarse = _samples(c0, c1, ns)
+                    a, b, f = _stitch(cs, coarse, rs[edge], cols, True)
+                    i0[edge, :], i1[edge, :], w[edge, :] = a, b, f
+                else:
+                    coarse = _samples(r0, r1, ns)
+                    a, b, f = _stitch(rs, coarse, cs[edge], cols, False)
+                    i0[:, edge], i1[:, edge], w[:, edge] = a, b, f
+            all_rows.append(r.ravel())
+            all_cols.append(c.ravel())
+            all_faces.append(quads(len(rs), len(cs), count))
+            all_i0.append(i0.ravel())
+            all_i1.append(i1.ravel())
+            all_w.append(w.ravel())
+            count += r.size
+    return GridLayout(
+        ("lod", step, level.tobytes()),
+        np.concatenate(all_rows),
+        np.concatenate(all_cols),
+        np.concatenate(all_faces),
+        np.concatenate(all_i0),
+        np.concatenate(all_i1),
+        np.concatenate(all_w).astype(np.float32),
+    )
+
+
+def wet_cells(water, terrain=None, depth=0.05):
+    """Cells with water, deeper than depth where the terrain is known"""
+    wet = np.isfinite(water)
+    if terrain is not None and terrain.shape == water.shape:
+        with np.errstate(invalid="ignore"):
+            wet &= ~(water - terrain <= depth)
+    return wet
+
+
+def dilate(values, mask, grow=1):
+    """Grows the mask by grow cells, new cells take the highest neighbour"""
+    rows, cols = values.shape
+    values = np.where(mask, values, -np.inf)
+    for _ in range(grow):
+        padded = np.pad(values, 1, constant_values=-np.inf)
+        grown = values
+        for dr in range(3):
+            for dc in range(3):
+                grown = np.maximum(grown, padded[dr : dr + rows, dc : dc + cols])
+        values = np.where(np.isfinite(values), values, grown)
+    mask = np.isfinite(values)
+    return np.where(mask, values, np.nan), mask
+
+
+def masked_layout(mask, shape, step=2):
+    """Grid of the step-th cells keeping only quads with all corners in mask.
+
+    The mask is given on the subsampled grid, unused vertices are dropped.
+    """
+    rows, cols = shape
+    faces = quads(*mask.shape)
+    faces = faces[mask.ravel()[faces].all(axis=1)]
+    used = np.zeros(mask.size, dtype=bool)
+    used[faces.ravel()] = True
+    remap = (np.cumsum(used) - 1).astype(np.int32)
+    r, c = np.meshgrid(
+        np.arange(0, rows, step), np.arange(0, cols, step), indexing="ij"
+    )
+    r = r.ravel()[used]
+    c = c.ravel()[used]
+    return GridLayout(("mask", step), r, c, remap[faces], r * cols + c)
+
+
+def interpolate_heights(data, georef, x, y):
+    """Heights bilinearly interpolated between cell centers, NaN outside"""
+    x0, y0 = georef.origin
+    dx, dy = georef.pixel_size
+    rows, cols = georef.shape
+    fc = (np.asarray(x) - x0) / dx - 0.5
+    fr = (np.asarray(y) - y0) / dy - 0.5
+    inside = (fr > -0.5) & (fr < rows - 0.5) & (fc > -0.5) & (fc < cols - 0.5)
+    fc = np.clip(fc, 0, cols - 1)
+    fr = np.clip(fr, 0, rows - 1)
+    c = np.minimum(fc.astype(int), max(cols - 2, 0))
+    r = np.minimum(fr.astype(int), max(rows - 2, 0))
+    wc = fc - c
+    wr = fr - r
+    c1 = np.minimum(c + 1, cols - 1)
+    r1 = np.minimum(r + 1, rows - 1)
+    top = data[r, c] * (1 - wc) + data[r, c1] * wc
+    bottom = data[r1, c] * (1 - wc) + data[r1, c1] * wc
+    z = top * (1 - wr) + bottom * wr
+    return np.where(inside, z, np.nan).astype(np.float32)
@@ -22,6 +22,10 @@
 
 import bmesh
 import array
+from collections import OrderedDict
+
+import numpy as np
+from mathutils.bvhtree import BVHTree
 
 
 def bmesh_copy_from_object(
@@ -102,22 +106,10 @@ def bmesh_check_self_intersect_object(obj):
     """
     Check if any faces self intersect
 
-    returns an array of edge index values.
+    returns an array of face index values.
     """
-    import bpy
-
-    if not obj.data.polygons:
-        return array.array("i", ())
-
-    bm = bmesh_copy_from_object(obj, transform=False, triangulate=False)
-
-    import mathutils
-
-    tree = mathutils.bvhtree.BVHTree.FromBMesh(bm, epsilon=0.00001)
-
-    overlap = tree.overlap(tree)
-    faces_error = {i for i_pair in overlap for i in i_pair}
-    return array.array("i", faces_error)
+    co, tris, polys = mesh_triangles(obj.data)
+    return array.array("i", check_intersections(co, tris, polys).tolist())
 
 
 def bmesh_face_points_random(f, num_points=1, margin=0.05):
@@ -147,66 +139,15 @@ def bmesh_face_points_random(f, num_points=1, margin=0.05):
 
 
 def bmesh_check_thick_object(obj, thickness):
+    """
+    Faces closer than thickness to the faces behind them, in world space
 
-    import bpy
-
-    # Triangulate
-    bm = bmesh_copy_from_object(obj, transform=True, triangulate=False)
-    # map original faces to their index.
-    face_index_map_org = {f: i for i, f in enumerate(bm.faces)}
-    ret = bmesh.ops.triangulate(bm, faces=bm.faces)
-    face_map = ret["face_map"]
-    del ret
-    # old edge -> new mapping
-
-    # Convert new/old map to index dict.
-
-    # Create a real mesh (lame!)
-    scene = bpy.context.scene
-    me_tmp = bpy.data.meshes.new(name="~temp~")
-    bm.to_mesh(me_tmp)
-    # bm.free()  # delay free
-    obj_tmp = bpy.data.objects.new(name=me_tmp.name, object_data=me_tmp)
-    scene.objects.link(obj_tmp)
-    scene.update()
-    ray_cast = obj_tmp.ray_cast
-
-    EPS_BIAS = 0.0001
-
-    faces_error = set()
-
-    bm_faces_new = bm.faces[:]
-
-    for f in bm_faces_new:
-        no = f.normal
-        no_sta = no * EPS_BIAS
-        no_end = no * thickness
-        for p in bmesh_face_points_random(f, num_points=6):
-            # Cast the ray backwards
-            p_a = p - no_sta
-            p_b = p - no_end
-            p_dir = p_b - p_a
-
-            ok, co, no, index = ray_cast(p_a, p_dir, p_dir.length)
-
-            if ok:
-                # Add the face we hit
-                for f_iter in (f, bm_faces_new[index]):
-                    # if the face wasn't triangulated, just use existing
-                    f_org = face_map.get(f_iter, f_iter)
-                    f_org_index = face_index_map_org[f_org]
-                    faces_error.add(f_org_index)
-
-    # finished with bm
-    bm.free()
-
-    scene.objects.unlink(obj_tmp)
-    bpy.data.objects.remove(obj_tmp)
-    bpy.data.meshes.remove(me_tmp)
-
-    scene.update()
-
-    return array.array("i", faces_error)
+    returns an array of face index values.
+    """
+    co, tris, polys = mesh_triangles(obj.data)
+    matrix = np.array(obj.matrix_world)
+    co = co @ matrix[:3, :3].T + matrix[:3, 3]
+    return array.array("i", check_thin(co, tris, polys, thickness).tolist())
 
 
 def object_merge(context, objects):
@@ -273,3 +214,139 @@ def object_merge(context, objects):
 
     # return new object
     return base_base
+
+
+# Batched checks on mesh arrays, fast enough to run on every layer update.
+# They take the arrays of mesh_triangles and return polygon indices.
+
+
+def mesh_triangles(mesh):
+    """
+    Vertex coordinates, vertex indices of the loop triangles and
+    the polygon every triangle belongs to
+    """
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    mesh.calc_loop_triangles()
+    count = len(mesh.loop_triangles)
+    tris = np.empty(count * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", tris)
+    polys = np.empty(count, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("polygon_index", polys)
+    return co.reshape(-1, 3), tris.reshape(-1, 3), polys
+
+
+def triangle_normals(co, tris):
+    """
+    Triangle normals, as long as twice the triangle area
+    """
+    a = co[tris[:, 0]]
+    return np.cross(co[tris[:, 1]] - a, co[tris[:, 2]] - a)
+
+
+def check_holes(co, tris, polys):
+    """
+    Polygons with NaN or infinite vertices, nodata holes of a raster
+    """
+    bad = ~np.isfinite(co).all(axis=1)
+    return np.unique(polys[bad[tris].any(axis=1)])
+
+
+def check_degenerate(co, tris, polys, min_area=1e-8):
+    """
+    Polygons without area
+    """
+    area = np.linalg.norm(triangle_normals(co, tris), axis=1) / 2
+    total = np.bincount(polys, area, minlength=polys.max(initial=-1) + 1)
+    # NaN areas are holes, not degenerate faces
+    return np.flatnonzero(total <= min_area)
+
+
+def check_flipped(co, tris, polys, up=(0, 0, 1), limit=0.2):
+    """
+    Polygons facing down, for surfaces that should face up
+    """
+    normals = triangle_normals(co, tris)
+    count = polys.max(initial=-1) + 1
+    length = np.linalg.norm(normals, axis=1)
+    facing = np.bincount(
+        polys, normals @ np.asarray(up, dtype=np.float32), minlength=count
+    )
+    total = np.bincount(polys, length, minlength=count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.flatnonzero(facing / total < -limit)
+
+
+def _finite_tree(co, tris, epsilon=0.0):
+    keep = np.flatnonzero(np.isfinite(co).all(axis=1)[tris].all(axis=1))
+    co = np.where(np.isfinite(co), co, 0)
+    tree = BVHTree.FromPolygons(co.tolist(), tris[keep].tolist(), epsilon=epsilon)
+    return tree, keep
+
+
+def check_intersections(co, tris, polys, epsilon=1e-5):
+    """
+    Polygons crossing other polygons, neighbours do not count
+    """
+    if not len(tris):
+        return np.empty(0, dtype=np.int64)
+    tree, keep = _finite_tree(co, tris, epsilon)
+    pairs = np.array(tree.overlap(tree), dtype=np.int64).reshape(-1, 2)
+    pairs = keep[pairs]
+    a = tris[pairs[:, 0]]
+    b = tris[pairs[:, 1]]
+    shared = (a[:, :, None] == b[:, None, :]).any(axis=(1, 2))
+    pairs = pairs[~shared]
+    return np.unique(polys[pairs.ravel()])
+
+
+def check_thin(co, tris, polys, thickness, samples=None):
+    """
+    Polygons closer than thickness to the surface behind them
+
+    Casts one ray backwards from the center of every triangle, all
+    against one BVH, or only of samples evenly spread triangles
+    when a quicker, partial check is enough.
+    """
+    if not len(tris) or thickness <= 0:
+        return np.empty(0, dtype=np.int64)
+    tree, finite = _finite_tree(co, tris)
+    picked = finite
+    if samples:
+        picked = finite[:: max(1, -(-len(finite) // samples))]
+    normals = triangle_normals(co, tris[picked])
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True) + 1e-12
+    starts = co[tris[picked]].mean(axis=1) - normals * 0.0001
+    ray_cast = tree.ray_cast
+    hits = []
+    rays = zip(picked.tolist(), starts.tolist(), (-normals).tolist())
+    for i, start, direction in rays:
+        index = ray_cast(start, direction, thickness)[2]
+        if index is not None:
+            hits.append((i, index))
+    if not hits:
+        return np.empty(0, dtype=np.int64)
+    hits = np.array(hits, dtype=np.int64)
+    hits[:, 1] = finite[hits[:, 1]]
+    return np.unique(polys[hits.ravel()])
+
+
+def check_mesh(mesh, up=(0, 0, 1), intersections=False, thickness=0, samples=None):
+    """
+    Runs the checks on a mesh, returns problem name -> polygon indices
+
+    Holes, degenerate and flipped faces only need the arrays, the
+    intersection and thickness checks build a BVH and are optional,
+    samples limits the thickness check to that many triangles.
+    """
+    co, tris, polys = mesh_triangles(mesh)
+    problems = OrderedDict()
+    problems["holes"] = check_holes(co, tris, polys)
+    problems["degenerate"] = check_degenerate(co, tris, polys)
+    if up is not None:
+        problems["flipped"] = check_flipped(co, tris, polys, up)
+    if intersections:
+        problems["intersections"] = check_intersections(co, tris, polys)
+    if thickness > 0:
+        problems["thin"] = check_thin(co, tris, polys, thickness, samples)
+    return OrderedDict((k, v) for k, v in problems.items() if len(v))
@@ -0,0 +1,83 @@
+import json
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[int(round(q * (len(values) - 1)))]
+
+
+class Profiler:
+    """Per stage timings of layer updates.
+
+    An update is opened with begin(), handlers time their stages with
+    stage() and end() stores the record, appending it to the JSON lines log
+    if one is set. Stages outside of an open update are not recorded.
+    """
+
+    def __init__(self, history=100):
+        self.history = history
+        self.log_path = None
+        # extra fields written with every record, e.g. versions and host
+        self.meta = {}
+        self.records = OrderedDict()
+        self._current = None
+
+    def begin(self, layer, files, stages=None):
+        self._current = {
+            "layer": layer,
+            "files": list(files),
+            "stages": OrderedDict(stages or ()),
+        }
+
+    @contextmanager
+    def stage(self, name):
+        start = timer()
+        try:
+            yield
+        finally:
+            if self._current is not None:
+                stages = self._current["stages"]
+                stages[name] = stages.get(name, 0) + timer() - start
+
+    def cancel(self):
+        self._current = None
+
+    def end(self):
+        record = self._current
+        self._current = None
+        if record is None:
+            return None
+        record["total"] = sum(record["stages"].values())
+        record["time"] = time.time()
+        record.update(self.meta)
+        layer = record["layer"]
+        if layer not in self.records:
+            self.records[layer] = deque(maxlen=self.history)
+        self.records[layer].append(record)
+        if self.log_path:
+            try:
+                with open(self.log_path, "a") as log:
+                    log.write(json.dumps(record) + "\n")
+            except OSError as e:
+                print("Could not write profile log: {}".format(e))
+        return record
+
+    def summary(self):
+        """Last, median and 95th percentile of the total time per layer"""
+        result = OrderedDict()
+        for layer, records in self.records.items():
+            totals = [r["total"] for r in records]
+            result[layer] = (
+                totals[-1],
+                percentile(totals, 0.5),
+                percentile(totals, 0.95),
+            )
+        return result
+
+
+# shared by the watch mode operator and the panel
+profiler = Profiler()
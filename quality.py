@@ -0,0 +1,130 @@
+from collections import deque
+from timeit import default_timer as timer
+
+from .profiling import percentile
+
+# realism tiers from cheapest to best looking
+TIERS = ("Low", "Medium", "High")
+
+# what every tier sets
+QUALITY = {
+    "Low": {
+        "water_material": "fast_water_material",
+        "interpolation": "Closest",
+        "tree_density": 0.25,
+        "trail_smooth": 0,
+        "texture_limit": "CLAMP_512",
+        "samples": 1,
+    },
+    "Medium": {
+        "water_material": "fast_water_material",
+        "interpolation": "Linear",
+        "tree_density": 0.5,
+        "trail_smooth": 1,
+        "texture_limit": "CLAMP_2048",
+        "samples": 8,
+    },
+    "High": {
+        "water_material": "water_material",
+        "interpolation": "Smart",
+        "tree_density": 1,
+        "trail_smooth": 2,
+        "texture_limit": "CLAMP_OFF",
+        "samples": 16,
+    },
+}
+
+
+class Governor:
+    """Steps the realism tier to hold a frame time and update time target.
+
+    Frame times are the intervals between successive draws of a viewport
+    region, so they take in GPU time and everything else that delays the
+    next frame. Gaps longer than idle are the viewport resting rather than
+    slow frames and are left out. Only frames of the last window seconds
+    count.
+
+    With vsync the intervals never get shorter than the refresh interval,
+    so frames count as slow only beyond tolerance over the target and
+    show no headroom below it. Once enough frames were seen since the last
+    change, the tier steps down when the 95th percentile misses a target.
+    It steps up when the frames hold their target and updates have ample
+    headroom, but not back into a tier it had to leave before backoff
+    seconds passed, which double every time that tier fails again.
+    """
+
+    def __init__(
+        self,
+        tier="High",
+        fps=60,
+        update=1.0,
+        frames=30,
+        window=2.0,
+        idle=1.0,
+        cooldown=3.0,
+        tolerance=0.25,
+        backoff=30.0,
+    ):
+        self.tier = tier
+        self.frame_target = 1 / fps
+        self.update_target = update
+        self.min_frames = frames
+        self.window = window
+        self.idle = idle
+        self.cooldown = cooldown
+        self.tolerance = tolerance
+        self.backoff = backoff
+        # (time drawn, seconds since the previous draw)
+        self.frames = deque()
+        self.updates = deque(maxlen=10)
+        self._changed = timer()
+        self._last_draw = {}
+        # tier -> (earliest time to step up into it again, next backoff)
+        self._failed = {}
+
+    def draw(self, region=None):
+        """Called when a region starts drawing, keyed to tell regions apart"""
+        now = timer()
+        last = self._last_draw.get(region)
+        self._last_draw[region] = now
+        if last is not None and now - last < self.idle:
+            self.frames.append((now, now - last))
+        self._expire(now)
+
+    def _expire(self, now):
+        while self.frames and now - self.frames[0][0] > self.window:
+            self.frames.popleft()
+
+    def update(self, seconds):
+        self.updates.append(seconds)
+
+    def _reset(self, tier):
+        self.tier = tier
+        self.frames.clear()
+        self._last_draw.clear()
+        self.updates.clear()
+        self._changed = timer()
+        return tier
+
+    def decide(self):
+        """New tier when quality should change, otherwise None"""
+        now = timer()
+        if now - self._changed < self.cooldown:
+            return None
+        self._expire(now)
+        if len(self.frames) < self.min_frames:
+            return None
+        frame = percentile([seconds for _, seconds in self.frames], 0.95)
+        update = percentile(self.updates, 0.95) if self.updates else 0
+        level = TIERS.index(self.tier)
+        frame_limit = self.frame_target * (1 + self.tolerance)
+        if frame > frame_limit or update > self.update_target:
+            if level > 0:
+                _, backoff = self._failed.get(self.tier, (0, self.backoff))
+                self._failed[self.tier] = now + backoff, backoff * 2
+                return self._reset(TIERS[level - 1])
+        elif update < self.update_target / 2 and level < len(TIERS) - 1:
+            better = TIERS[level + 1]
+            if now >= self._failed.get(better, (0, 0))[0]:
+                return self._reset(better)
+        return None
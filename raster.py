@@ -0,0 +1,452 @@
+import struct
+import zlib
+
+import numpy as np
+
+# TIFF tags used by the reader
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+STRIP_OFFSETS = 273
+SAMPLES_PER_PIXEL = 277
+ROWS_PER_STRIP = 278
+STRIP_BYTE_COUNTS = 279
+PLANAR_CONFIG = 284
+PREDICTOR = 317
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+TILE_BYTE_COUNTS = 325
+SAMPLE_FORMAT = 339
+MODEL_PIXEL_SCALE = 33550
+MODEL_TIEPOINT = 33922
+MODEL_TRANSFORMATION = 34264
+GEO_KEY_DIRECTORY = 34735
+GDAL_NODATA = 42113
+
+# GeoKey telling whether the tie point refers to pixel corner or center
+RASTER_TYPE_KEY = 1025
+PIXEL_IS_POINT = 2
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG color type -> samples per pixel
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# TIFF field type -> struct format
+FIELD_TYPES = {
+    1: "B",
+    2: "s",
+    3: "H",
+    4: "I",
+    5: "II",
+    6: "b",
+    7: "B",
+    8: "h",
+    9: "i",
+    10: "ii",
+    11: "f",
+    12: "d",
+}
+
+SAMPLE_KINDS = {1: "u", 2: "i", 3: "f"}
+
+
+class GeoRef:
+    """Georeferencing of a north-up raster grid"""
+
+    def __init__(self, origin, pixel_size, shape, nodata=None):
+        # origin is the upper left corner, pixel height is negative
+        self.origin = origin
+        self.pixel_size = pixel_size
+        self.shape = shape
+        self.nodata = nodata
+
+    @property
+    def key(self):
+        """Hashable description of the grid, equal for identical grids"""
+        return (self.origin, self.pixel_size, self.shape)
+
+    @property
+    def extent(self):
+        x0, y0 = self.origin
+        dx, dy = self.pixel_size
+        rows, cols = self.shape
+        return x0, y0 + rows * dy, x0 + cols * dx, y0
+
+    @property
+    def center(self):
+        xmin, ymin, xmax, ymax = self.extent
+        return (xmin + xmax) / 2, (ymin + ymax) / 2
+
+
+def _read_ifd(f, endian):
+    f.seek(4)
+    (offset,) = struct.unpack(endian + "I", f.read(4))
+    f.seek(offset)
+    (count,) = struct.unpack(endian + "H", f.read(2))
+    entries = [struct.unpack(endian + "HHII", f.read(12)) for i in range(count)]
+    tags = {}
+    for tag, field_type, n, value in entries:
+        if field_type not in FIELD_TYPES:
+            continue
+        fmt = FIELD_TYPES[field_type]
+        size = struct.calcsize(endian + fmt) * n if fmt != "s" else n
+        if size <= 4:
+            raw = struct.pack(endian + "I", value)[:size]
+        else:
+            f.seek(value)
+            raw = f.read(size)
+        if fmt == "s":
+            tags[tag] = raw.split(b"\x00")[0].decode("ascii", "replace")
+        else:
+            values = struct.unpack(endian + fmt * n, raw)
+            if field_type in (5, 10):
+                values = tuple(
+                    values[i] / values[i + 1] for i in range(0, len(values), 2)
+                )
+            tags[tag] = values
+    return tags
+
+
+def _lzw_decode(data):
+    """TIFF flavour of LZW: MSB first codes with early change"""
+    table = [bytes([i]) for i in range(256)] + [b"", b""]
+    out = bytearray()
+    bits = 9
+    buf = 0
+    nbits = 0
+    prev = None
+    for byte in data:
+        buf = (buf << 8) | byte
+        nbits += 8
+        while nbits >= bits:
+            nbits -= bits
+            code = (buf >> nbits) & ((1 << bits) - 1)
+            if code == 256:
+                table = table[:258]
+                bits = 9
+                prev = None
+                continue
+            if code == 257:
+                return bytes(out)
+            if prev is None:
+                entry = table[code]
+            elif code < len(table):
+                entry = table[code]
+                table.append(prev + entry[:1])
+            else:
+                entry = prev + prev[:1]
+                table.append(entry)
+            out += entry
+            prev = entry
+            if len(table) + 1 >= (1 << bits) and bits < 12:
+                bits += 1
+    return bytes(out)
+
+
+def _packbits_decode(data):
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        n = data[i]
+        i += 1
+        if n < 128:
+            out += data[i : i + n + 1]
+            i += n + 1
+        elif n > 128:
+            out += data[i : i + 1] * (257 - n)
+            i += 1
+    return bytes(out)
+
+
+def _decompress(raw, compression):
+    if compression == 1:
+        return raw
+    if compression in (8, 32946):
+        return zlib.decompress(raw)
+    if compression == 5:
+        return _lzw_decode(raw)
+    if compression == 32773:
+        return _packbits_decode(raw)
+    raise RuntimeError("Unsupported TIFF compression {}".format(compression))
+
+
+def _decode_chunk(raw, rows, cols, samples, dtype, predictor):
+    """Turns one decompressed strip or tile into a (rows, cols, samples) array"""
+    size = rows * cols * samples * dtype.itemsize
+    buf = np.frombuffer(raw, dtype=np.uint8)[:size]
+    if buf.size < size:
+        raise RuntimeError("Truncated TIFF data")
+    if predictor == 3:
+        # floating point predictor: byte planes, most significant first
+        buf = buf.reshape(rows, cols * samples * dtype.itemsize)
+        buf = buf.reshape(rows, -1, samples)
+        buf = np.cumsum(buf, axis=1, dtype=np.uint8)
+        buf = buf.reshape(rows, dtype.itemsize, cols * samples)
+        buf = np.ascontiguousarray(buf.transpose(0, 2, 1))
+        return buf.view(dtype.newbyteorder(">")).reshape(rows, cols, samples)
+    arr = buf.view(dtype).reshape(rows, cols, samples)
+    if predictor == 2:
+        arr = np.cumsum(arr, axis=1, dtype=arr.dtype)
+    return arr
+
+
+def _georef(tags, shape, nodata):
+    raster_type = None
+    keys = tags.get(GEO_KEY_DIRECTORY)
+    if keys:
+        for i in range(4, len(keys), 4):
+            if keys[i] == RASTER_TYPE_KEY:
+                raster_type = keys[i + 3]
+    if MODEL_TRANSFORMATION in tags:
+        m = tags[MODEL_TRANSFORMATION]
+        origin = (m[3], m[7])
+        pixel_size = (m[0], m[5])
+    elif MODEL_TIEPOINT in tags and MODEL_PIXEL_SCALE in tags:
+        i, j, k, x, y, z = tags[MODEL_TIEPOINT][:6]
+        sx, sy = tags[MODEL_PIXEL_SCALE][:2]
+        origin = (x - i * sx, y + j * sy)
+        pixel_size = (sx, -sy)
+    else:
+        raise RuntimeError("Raster is not georeferenced")
+    if raster_type == PIXEL_IS_POINT:
+        origin = (origin[0] - pixel_size[0] / 2, origin[1] - pixel_size[1] / 2)
+    return GeoRef(origin, pixel_size, shape, nodata)
+
+
+def read_geotiff(path):
+    """Reads the first band of a GeoTIFF as float32 with nodata set to NaN
+
+    Returns the array and its GeoRef.
+    """
+    try:
+        return _read_geotiff(path)
+    except (struct.error, zlib.error, ValueError, KeyError, IndexError) as e:
+        raise RuntimeError("Could not read {}: {}".format(path, e))
+
+
+def _read_geotiff(path):
+    with open(path, "rb") as f:
+        order = f.read(2)
+        if order == b"II":
+            endian = "<"
+        elif order == b"MM":
+            endian = ">"
+        else:
+            raise RuntimeError("{} is not a TIFF file".format(path))
+        (magic,) = struct.unpack(endian + "H", f.read(2))
+        if magic != 42:
+            raise RuntimeError("{} is not a classic TIFF file".format(path))
+        tags = _read_ifd(f, endian)
+
+        cols = tags[IMAGE_WIDTH][0]
+        rows = tags[IMAGE_LENGTH][0]
+        samples = tags.get(SAMPLES_PER_PIXEL, (1,))[0]
+        bits = tags.get(BITS_PER_SAMPLE, (1,))[0]
+        kind = SAMPLE_KINDS.get(tags.get(SAMPLE_FORMAT, (1,))[0], "u")
+        compression = tags.get(COMPRESSION, (1,))[0]
+        predictor = tags.get(PREDICTOR, (1,))[0]
+        planar = tags.get(PLANAR_CONFIG, (1,))[0]
+        if bits not in (8, 16, 32, 64) or (kind == "f" and bits == 8):
+            raise RuntimeError("{} has {} bit samples".format(path, bits))
+        dtype = np.dtype("{}{}{}".format(endian, kind, bits // 8))
+
+        tiled = TILE_OFFSETS in tags
+        if tiled:
+            chunk_cols = tags[TILE_WIDTH][0]
+            chunk_rows = tags[TILE_LENGTH][0]
+            offsets = tags[TILE_OFFSETS]
+            counts = tags[TILE_BYTE_COUNTS]
+        else:
+            chunk_cols = cols
+            chunk_rows = min(tags.get(ROWS_PER_STRIP, (rows,))[0], rows)
+            offsets = tags[STRIP_OFFSETS]
+            counts = tags[STRIP_BYTE_COUNTS]
+        across = -(-cols // chunk_cols)
+        down = -(-rows // chunk_rows)
+        chunk_samples = samples
+        if planar == 2:
+            # separate planes, only the first band is needed
+            chunk_samples = 1
+            offsets = offsets[: across * down]
+
+        data = np.empty((rows, cols), dtype=dtype.newbyteorder("="))
+        for index, (offset, count) in enumerate(zip(offsets, counts)):
+            f.seek(offset)
+            raw = _decompress(f.read(count), compression)
+            r0 = (index // across) * chunk_rows
+            c0 = (index % across) * chunk_cols
+            r1 = min(r0 + chunk_rows, rows)
+            c1 = min(c0 + chunk_cols, cols)
+            # the last strip only holds the remaining rows
+            chunk = _decode_chunk(
+                raw,
+                chunk_rows if tiled else r1 - r0,
+                chunk_cols,
+                chunk_samples,
+                dtype,
+                predictor,
+            )
+            data[r0:r1, c0:c1] = chunk[: r1 - r0, : c1 - c0, 0]
+
+    nodata = None
+    if GDAL_NODATA in tags:
+        try:
+            nodata = float(tags[GDAL_NODATA])
+        except ValueError:
+            pass
+    data = data.astype(np.float32)
+    if nodata is not None and not np.isnan(nodata):
+        data[data == np.float32(nodata)] = np.nan
+    return data, _georef(tags, (rows, cols), nodata)
+
+
+def _unfilter(raw, rows, stride, bpp):
+    """Reverses PNG scanline filters, returns (rows, stride) uint8"""
+    raw = np.frombuffer(raw, dtype=np.uint8)
+    if raw.size < rows * (stride + 1):
+        raise RuntimeError("Truncated PNG data")
+    raw = raw[: rows * (stride + 1)].reshape(rows, stride + 1)
+    kinds = raw[:, 0]
+    if kinds.size and kinds.max() > 4:
+        raise RuntimeError("Invalid PNG filter {}".format(kinds.max()))
+    if np.isin(kinds, (3, 4)).any():
+        return _unfilter_diagonals(raw[:, 1:], kinds, bpp)
+    out = np.zeros((rows + 1, stride), dtype=np.uint8)
+    for r in range(rows):
+        kind = kinds[r]
+        line = raw[r, 1:]
+        if kind == 0:
+            out[r + 1] = line
+        elif kind == 1:
+            out[r + 1] = np.cumsum(
+                line.reshape(-1, bpp), axis=0, dtype=np.uint8
+            ).ravel()
+        else:
+            out[r + 1] = line + out[r]
+    return out[1:]
+
+
+def _unfilter_diagonals(lines, kinds, bpp, band=512):
+    """Reverses any filters, a diagonal of pixels at a time.
+
+    Average and paeth depend on the pixel just decoded to the left, so a
+    row cannot be undone at once. A pixel only depends on the pixels left,
+    above and above left of it though, so all pixels of an anti-diagonal
+    are decoded together, every row with its own filter. Bands of rows are
+    sheared so that their diagonals become columns and plain slices.
+    """
+    rows, stride = lines.shape
+    cols = -(-stride // bpp)
+    pixels = np.zeros((rows, cols * bpp), dtype=np.int16)
+    pixels[:, :stride] = lines
+    pixels = pixels.reshape(rows, cols, bpp)
+    out = np.empty((rows, cols, bpp), dtype=np.int16)
+    above = np.zeros((cols, bpp), dtype=np.int16)
+    for r0 in range(0, rows, band):
+        n = min(band, rows - r0)
+        r = np.arange(n)[:, np.newaxis]
+        c = np.arange(cols)[np.newaxis, :]
+        sheared = np.zeros((n, n + cols - 1, bpp), dtype=np.int16)
+        sheared[r, r + c] = pixels[r0 : r0 + n]
+        # pixel (r, c) goes to done[r + 1, r + c + 2], leaving zeros above
+        # and left of the band for the missing neighbours
+        done = np.zeros((n + 1, n + cols + 1, bpp), dtype=np.int16)
+        done[0, 1 : cols + 1] = above
+        kind = kinds[r0 : r0 + n, np.newaxis]
+        use_left = np.isin(kind, (1, 3)).astype(np.int16)
+        use_up = np.isin(kind, (2, 3)).astype(np.int16)
+        halve = (kind == 3).astype(np.int16)
+        paeth = kind == 4
+        for k in range(n + cols - 1):
+            a, b = max(0, k - cols + 1), min(n, k + 1)
+            left = done[a + 1 : b + 1, k + 1]
+            up = done[a:b, k + 1]
+            pred = (left * use_left[a:b] + up * use_up[a:b]) >> halve[a:b]
+            if paeth[a:b].any():
+                upleft = done[a:b, k]
+                pa = np.abs(up - upleft)
+                pb = np.abs(left - upleft)
+                pc = np.abs(left + up - 2 * upleft)
+                nearest = np.where(
+                    (pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, upleft)
+                )
+                pred = np.where(paeth[a:b], nearest, pred)
+            done[a + 1 : b + 1, k + 2] = (sheared[a:b, k] + pred) & 0xFF
+        out[r0 : r0 + n] = done[1:][r, r + c + 2]
+        above = out[r0 + n - 1]
+    return out.reshape(rows, -1)[:, :stride].astype(np.uint8)
+
+
+def read_png(path):
+    """Decodes a PNG into a (rows, cols, 4) uint8 RGBA array, top row first"""
+    try:
+        return _read_png(path)
+    except (struct.error, zlib.error, ValueError, KeyError, IndexError) as e:
+        raise RuntimeError("Could not read {}: {}".format(path, e))
+
+
+def _read_png(path):
+    with open(path, "rb") as f:
+        content = f.read()
+    if not content.startswith(PNG_SIGNATURE):
+        raise RuntimeError("{} is not a PNG file".format(path))
+    pos = len(PNG_SIGNATURE)
+    idat = []
+    palette = None
+    transparency = None
+    header = None
+    while pos < len(content):
+        length, kind = struct.unpack(">I4s", content[pos : pos + 8])
+        chunk = content[pos + 8 : pos + 8 + length]
+        pos += 12 + length
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", chunk)
+        elif kind == b"PLTE":
+            palette = np.frombuffer(chunk, dtype=np.uint8).reshape(-1, 3)
+        elif kind == b"tRNS":
+            transparency = np.frombuffer(chunk, dtype=np.uint8)
+        elif kind == b"IDAT":
+            idat.append(chunk)
+        elif kind == b"IEND":
+            break
+    else:
+        raise RuntimeError("Truncated PNG data")
+    cols, rows, depth, color, _, _, interlace = header
+    if interlace:
+        raise RuntimeError("Interlaced PNG is not supported")
+    channels = PNG_CHANNELS[color]
+    bits = channels * depth
+    stride = (cols * bits + 7) // 8
+    bpp = max(1, bits // 8)
+    data = _unfilter(zlib.decompress(b"".join(idat)), rows, stride, bpp)
+
+    if depth == 16:
+        data = data.view(">u2").reshape(rows, cols, channels) >> 8
+        data = data.astype(np.uint8)
+    elif depth == 8:
+        data = data.reshape(rows, cols, channels)
+    else:
+        data = np.unpackbits(data, axis=1).reshape(rows, -1, depth)
+        weights = 1 << np.arange(depth - 1, -1, -1, dtype=np.uint8)
+        data = (data * weights).sum(axis=2, dtype=np.uint8)[:, :cols, np.newaxis]
+        if color == 0:
+            data = data * (255 // ((1 << depth) - 1))
+
+    rgba = np.empty((rows, cols, 4), dtype=np.uint8)
+    rgba[..., 3] = 255
+    if color == 3:
+        index = data[..., 0]
+        rgba[..., :3] = palette[index]
+        if transparency is not None:
+            alpha = np.full(256, 255, dtype=np.uint8)
+            alpha[: len(transparency)] = transparency
+            rgba[..., 3] = alpha[index]
+    elif color in (0, 4):
+        rgba[..., :3] = data[..., :1]
+        if color == 4:
+            rgba[..., 3] = data[..., 1]
+    else:
+        rgba[..., :channels] = data
+    return rgba
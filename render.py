@@ -0,0 +1,92 @@
+import json
+import os
+import subprocess
+from collections import deque
+from timeit import default_timer as timer
+
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "render_worker.py")
+
+
+class BatchRender:
+    """Renders cameras of a saved scene in background Blender processes.
+
+    At most workers renders run at once, the rest wait in a queue. poll()
+    has to be called regularly, it starts queued cameras, collects
+    finished ones and writes timing.json next to the frames at the end.
+    """
+
+    def __init__(self, binary):
+        self.binary = binary
+        self.queue = deque()
+        self.running = {}
+        self.times = {}
+        self.blend = None
+        self.folder = None
+        self.workers = 1
+        self.engine = "CYCLES"
+        # another batch was requested while this one ran
+        self.pending = False
+
+    @property
+    def busy(self):
+        return bool(self.queue or self.running)
+
+    def start(self, blend, cameras, folder, workers=None, engine="CYCLES"):
+        self.blend = blend
+        self.folder = folder
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.engine = engine
+        self.times = {}
+        self.queue.extend(cameras)
+        self._launch()
+
+    def _launch(self):
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        while self.queue and len(self.running) < self.workers:
+            camera = self.queue.popleft()
+            output = os.path.join(self.folder, camera + ".png")
+            command = [
+                self.binary,
+                "--background",
+                self.blend,
+                "--threads",
+                str(threads),
+                "--python",
+                WORKER,
+                "--",
+                camera,
+                output,
+                self.engine,
+            ]
+            process = subprocess.Popen(
+                command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            self.running[camera] = process, timer()
+
+    def poll(self):
+        """Collects finished renders, returns True when the batch just ended"""
+        for camera, (process, start) in list(self.running.items()):
+            if process.poll() is not None:
+                self.times[camera] = {
+                    "seconds": timer() - start,
+                    "ok": process.returncode == 0,
+                }
+                del self.running[camera]
+        self._launch()
+        if self.blend is None or self.busy:
+            return False
+        try:
+            with open(os.path.join(self.folder, "timing.json"), "w") as f:
+                json.dump(self.times, f, indent="\t")
+            os.remove(self.blend)
+        except OSError as e:
+            print("Could not finish batch render: {}".format(e))
+        self.blend = None
+        return True
+
+    def close(self):
+        self.queue.clear()
+        for process, start in self.running.values():
+            process.terminate()
+        self.running.clear()
+        self.pending = False
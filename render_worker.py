@@ -0,0 +1,19 @@
+"""Renders one camera of the opened scene, run by BatchRender as
+
+blender --background scene.blend --python render_worker.py -- camera output engine
+"""
+
+import sys
+
+import bpy
+
+camera, output, engine = sys.argv[sys.argv.index("--") + 1 :][:3]
+# the snapshot holds just this scene, also when no window opened it
+scene = bpy.context.scene or bpy.data.scenes[0]
+scene.camera = bpy.data.objects[camera]
+scene.render.engine = engine
+if engine == "CYCLES":
+    scene.cycles.device = "CPU"
+scene.render.image_settings.file_format = "PNG"
+scene.render.filepath = output
+bpy.ops.render.render(write_still=True)
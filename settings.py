@@ -1,20 +1,152 @@
 import os
+import copy
 import json
 
 cfgFile = os.path.dirname(os.path.abspath(__file__)) + "/settings.json"
 
+# keys every settings file needs, nested dicts list their own keys
+REQUIRED = {
+    "folder": str,
+    "CRS": str,
+    "timer": (int, float),
+    "scale": (int, float),
+    "terrain": {"grass_texture_file": str, "sides_texture_file": str},
+    "trees": dict,
+    "trail": {"profile": str, "texture_file": str},
+    "world": {"texture_file": str},
+}
+
+# keys a settings file may leave out, checked only when present
+OPTIONAL = {
+    "settle": (int, float),
+    "socket": (str, type(None)),
+    "worker_processes": bool,
+    "batch_render": bool,
+    "render_cameras": list,
+    "render_workers": (int, type(None)),
+    "render_engine": str,
+    "lod": bool,
+    "terrain_tile": (int, float),
+    "terrain_tolerance": (int, float),
+    "qa": {
+        "enabled": bool,
+        "intersections": bool,
+        "thickness": (int, float),
+        "samples": (int, type(None)),
+    },
+    "water": {"depth": (int, float), "grow": int},
+    "realism": str,
+    "governor": bool,
+    "target_fps": (int, float),
+    "target_update": (int, float),
+}
+
+# keys a tree class may set besides its model
+TREE = {"texture": str, "density": (int, float)}
+
+# parsed settings and the modification time of the file they came from
+_cache = {"mtime": None, "prefs": None}
+# settings the listeners last saw, apart from the cache so that reading
+# the settings between checks does not hide a change from them
+_notified = {"prefs": None}
+# called with the new settings whenever the file changes
+_listeners = []
+
+
+def _check(prefs, schema, path, required=True):
+    errors = []
+    for key, kind in schema.items():
+        name = path + key
+        if key not in prefs:
+            if required:
+                errors.append("missing {}".format(name))
+        elif isinstance(kind, dict):
+            if not isinstance(prefs[key], dict):
+                errors.append("{} must be an object".format(name))
+            else:
+                errors.extend(_check(prefs[key], kind, name + ".", required))
+        elif not isinstance(prefs[key], kind) or (
+            # bool is an int but never a number setting
+            isinstance(prefs[key], bool)
+            and kind is not bool
+        ):
+            errors.append("{} has the wrong type".format(name))
+    return errors
+
+
+def validateSettings(prefs):
+    """Raises ValueError listing everything wrong with the settings"""
+    errors = _check(prefs, REQUIRED, "")
+    errors.extend(_check(prefs, OPTIONAL, "", required=False))
+    trees = prefs.get("trees")
+    for name, tree in trees.items() if isinstance(trees, dict) else ():
+        if not isinstance(tree, dict) or not isinstance(tree.get("model"), str):
+            errors.append("trees.{} needs a model".format(name))
+        else:
+            errors.extend(_check(tree, TREE, "trees.{}.".format(name), required=False))
+    if not errors and prefs["timer"] <= 0:
+        errors.append("timer must be positive")
+    if errors:
+        raise ValueError("Invalid {}: {}".format(cfgFile, ", ".join(errors)))
+
+
+def _load():
+    mtime = os.stat(cfgFile).st_mtime_ns
+    if mtime != _cache["mtime"] or _cache["prefs"] is None:
+        # a broken file is reported once, not on every check
+        _cache["mtime"] = mtime
+        with open(cfgFile, "r") as cfg:
+            prefs = json.load(cfg)
+        validateSettings(prefs)
+        _cache["prefs"] = prefs
+        _cache["mtime"] = mtime
+        # whatever was read first is what everyone started with
+        if _notified["prefs"] is None:
+            _notified["prefs"] = prefs
+    return _cache["prefs"]
+
 
 def getSettings():
-    with open(cfgFile, "r") as cfg:
-        prefs = json.load(cfg)
-    return prefs
+    """Settings parsed once and again only after the file changed"""
+    return copy.deepcopy(_load())
 
 
 def setSettings(prefs):
+    validateSettings(prefs)
     with open(cfgFile, "w") as cfg:
         json.dump(prefs, cfg, indent="\t")
+    checkSettings()
 
 
 def getSetting(k):
     prefs = getSettings()
     return prefs.get(k, None)
+
+
+def addSettingsListener(listener):
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def removeSettingsListener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def checkSettings():
+    """Reloads a changed settings file and passes it to the listeners.
+
+    Invalid files are reported and ignored, the last valid settings stay.
+    Returns whether the settings changed.
+    """
+    try:
+        prefs = _load()
+    except (OSError, ValueError) as e:
+        print("Could not reload settings: {}".format(e))
+        return False
+    if prefs is _notified["prefs"]:
+        return False
+    _notified["prefs"] = prefs
+    for listener in list(_listeners):
+        listener(copy.deepcopy(prefs))
+    return True
@@ -0,0 +1,194 @@
+import bpy
+import numpy as np
+
+from .binary import read_grid
+from .grid import interpolate_heights, lod_layout, uniform_layout
+
+
+def scene_origin(center, CRS):
+    """Projected coordinates of the scene origin.
+
+    Uses the BlenderGIS scene keys so that shapefiles imported with
+    importgis stay aligned, the first layer sets the origin to its center.
+    """
+    scn = bpy.context.scene
+    if "crs x" not in scn or "crs y" not in scn:
+        scn["crs"] = CRS
+        scn["crs x"], scn["crs y"] = center
+    return scn["crs x"], scn["crs y"]
+
+
+class TerrainQuery:
+    """Height queries against the current terrain.
+
+    Built once per terrain update and shared by everything placed on the
+    terrain. Heights are interpolated from the raster, all coordinates are
+    scene coordinates.
+    """
+
+    def __init__(self, data, georef, origin, name):
+        self.data = data
+        self.georef = georef
+        self.origin = origin
+        self.name = name
+
+    def _map(self, x, y):
+        return np.asarray(x) + self.origin[0], np.asarray(y) + self.origin[1]
+
+    def heights(self, x, y):
+        """Terrain heights, NaN outside the terrain"""
+        return interpolate_heights(self.data, self.georef, *self._map(x, y))
+
+
+def drape(mesh, before, after, corners=4):
+    """Moves instance faces with the ground they stand on.
+
+    before and after are TerrainQuery objects of the old and new terrain,
+    faces where the ground moved less than a millimeter stay. Returns the
+    number of faces moved.
+    """
+    co = read_coordinates(mesh).reshape(-1, corners, 3)
+    if not len(co):
+        return 0
+    centers = co.mean(axis=1)
+    dz = after.heights(centers[:, 0], centers[:, 1])
+    dz -= before.heights(centers[:, 0], centers[:, 1])
+    moved = np.isfinite(dz) & (np.abs(dz) > 0.001)
+    if not moved.any():
+        return 0
+    co[moved, :, 2] += dz[moved, None]
+    mesh.vertices.foreach_set("co", co.ravel())
+    mesh.update()
+    return int(moved.sum())
+
+
+def mesh_from_arrays(name, co, faces, uv=None):
+    """Builds a mesh datablock with bulk writes, faces share one corner count"""
+    mesh = bpy.data.meshes.new(name)
+    corners = faces.shape[1]
+    mesh.vertices.add(len(co))
+    mesh.loops.add(faces.size)
+    mesh.polygons.add(len(faces))
+    mesh.vertices.foreach_set("co", co.astype(np.float32).ravel())
+    mesh.loops.foreach_set("vertex_index", faces.astype(np.int32).ravel())
+    mesh.polygons.foreach_set(
+        "loop_start", np.arange(0, faces.size, corners, dtype=np.int32)
+    )
+    mesh.polygons.foreach_set(
+        "loop_total", np.full(len(faces), corners, dtype=np.int32)
+    )
+    if uv is not None:
+        layer = mesh.uv_layers.new(name="demUVmap")
+        layer.data.foreach_set("uv", uv[faces.ravel()].astype(np.float32).ravel())
+    mesh.update(calc_edges=True)
+    return mesh
+
+
+def grid_mesh(name, data, georef, CRS, layout):
+    origin = scene_origin(georef.center, CRS)
+    co, uv = layout.arrays(data, georef, origin)
+    return mesh_from_arrays(name, co, layout.faces, uv)
+
+
+def prepare_terrain(path, origin=None, step=2, eye=None):
+    """Reads a DEM layer and builds its mesh arrays, without touching Blender data.
+
+    Runs on the decoder so that only the bulk writes are left to the main
+    thread. Without a scene origin yet the DEM center will become it, with
+    an eye location the layout gets finer close to it, without a step only
+    the raster is read. Returns the raster,
+    its georef and the origin, step and eye the arrays were built for
+    followed by the layout key, vertices, faces and uvs.
+    """
+    data, georef = read_grid(path)
+    if step is None:
+        # tiled terrain, tiles are built where they changed
+        return data, georef, None
+    if origin is None:
+        origin = georef.center
+    if eye is None:
+        layout = uniform_layout(georef.shape, step)
+    else:
+        layout = lod_layout(data, georef, origin, eye[1], step=step)
+    co, uv = layout.arrays(data, georef, origin)
+    params = (tuple(origin), step, eye)
+    return data, georef, (params, layout.key, co, layout.faces, uv)
+
+
+def grid_object(name, data, georef, CRS, layout):
+    """Creates the mesh object of a DEM, the way importgis DEM import does"""
+    return mesh_object(name, grid_mesh(name, data, georef, CRS, layout))
+
+
+def mesh_object(name, mesh):
+    """Links a new object for a mesh into the scene and makes it active"""
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.context.view_layer.update()
+    bpy.ops.object.select_all(action="DESELECT")
+    obj.select_set(True)
+    bpy.context.view_layer.objects.active = obj
+    return obj
+
+
+def replace_mesh(obj, mesh):
+    """Swaps the mesh of an object, keeping its materials and modifiers"""
+    old = obj.data
+    for material in old.materials:
+        mesh.materials.append(material)
+    obj.data = mesh
+    name = old.name
+    bpy.data.meshes.remove(old)
+    mesh.name = name
+
+
+def read_coordinates(mesh):
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    return co.reshape(-1, 3)
+
+
+def skirt_mask(co, tres=0.1):
+    """Vertices on the grid boundary, the ones addSide drops to build the skirt"""
+    x = co[:, 0]
+    y = co[:, 1]
+    xmin, xmax = np.nanmin(x), np.nanmax(x)
+    ymin, ymax = np.nanmin(y), np.nanmax(y)
+    return (
+        (np.abs(x - xmin) < tres)
+        | (np.abs(y - ymin) < tres)
+        | (np.abs(x - xmax) < tres)
+        | (np.abs(y - ymax) < tres)
+    )
+
+
+def update_heights(obj, z, skirt, fringe, floor=None):
+    """Writes new heights into an existing grid mesh keeping its skirt.
+
+    The skirt hangs fringe below floor, by default the lowest height.
+    """
+    z = z.astype(np.float32)
+    if floor is None:
+        floor = np.nanmin(z)
+    z[skirt] = floor - fringe
+    mesh = obj.data
+    co = read_coordinates(mesh)
+    co[:, 2] = z
+    mesh.vertices.foreach_set("co", co.ravel())
+    mesh.update()
+
+
+def side_faces(mesh, limit=0.2):
+    """Faces whose normal points neither up nor down"""
+    normals = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+    mesh.polygons.foreach_get("normal", normals)
+    nz = normals[2::3]
+    return ~(nz > limit) & ~(nz < -limit)
+
+
+def set_material_index(mesh, faces, index):
+    indices = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", indices)
+    indices[faces] = index
+    mesh.polygons.foreach_set("material_index", indices)
+    mesh.update()
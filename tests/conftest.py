@@ -0,0 +1,18 @@
+"""Loads the add-on modules that work without Blender.
+
+The package __init__ registers the add-on with Blender, so the test session
+gets an empty package pointing at the add-on folder, under the folder name
+pytest collects it as and as addon, which the tests import modules from.
+"""
+
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for name in ("addon", os.path.basename(ROOT)):
+    if name not in sys.modules:
+        package = types.ModuleType(name)
+        package.__path__ = [ROOT]
+        sys.modules[name] = package
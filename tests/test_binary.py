@@ -0,0 +1,111 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from addon.benchmark import write_geotiff, write_png, write_shapefile
+from addon.binary import (
+    binary_name,
+    read_grid,
+    read_header,
+    read_image,
+    read_lines,
+    write_layer,
+)
+from addon.raster import GeoRef
+
+
+def test_raster_round_trip(tmp_path):
+    path = str(tmp_path / "elevation.tlb")
+    data = np.arange(12, dtype=np.float32).reshape(3, 4)
+    data[1, 2] = np.nan
+    georef = GeoRef((630000.0, 215500.0), (2.0, -2.0), data.shape)
+    write_layer(path, data, georef)
+    header, offset = read_header(path)
+    assert offset % 16 == 0
+    grid, read = read_grid(path)
+    np.testing.assert_array_equal(grid, data)
+    assert read.key == georef.key
+
+
+def test_float64_raster_is_read_as_float32(tmp_path):
+    path = str(tmp_path / "water.tlb")
+    georef = GeoRef((0.0, 3.0), (1.0, -1.0), (3, 3))
+    write_layer(path, np.ones((3, 3)), georef)
+    assert read_grid(path)[0].dtype == np.float32
+
+
+def test_lines_round_trip(tmp_path):
+    path = str(tmp_path / "trail.tlb")
+    lines = [np.random.rand(n, 3) for n in (2, 5, 3)]
+    write_layer(path, np.concatenate(lines), parts=[len(l) for l in lines])
+    for read, line in zip(read_lines(path), lines):
+        np.testing.assert_array_equal(read, line)
+
+
+def test_image_round_trip(tmp_path):
+    path = str(tmp_path / "patch_class1.tlb")
+    rgba = np.random.randint(0, 256, (4, 5, 4)).astype(np.uint8)
+    write_layer(path, rgba)
+    np.testing.assert_array_equal(read_image(path), rgba)
+
+
+@pytest.mark.parametrize("shape", [(4, 5), (4, 5, 3)])
+def test_image_must_be_rgba(tmp_path, shape):
+    path = str(tmp_path / "patch_class1.tlb")
+    write_layer(path, np.zeros(shape, dtype=np.uint8))
+    with pytest.raises(RuntimeError):
+        read_image(path)
+
+
+def test_not_a_binary_layer(tmp_path):
+    path = tmp_path / "elevation.tlb"
+    path.write_bytes(b"GeoTIFF?")
+    with pytest.raises(RuntimeError):
+        read_grid(str(path))
+
+
+def test_same_layers_as_the_standard_formats(tmp_path):
+    data = np.random.rand(6, 7).astype(np.float32)
+    write_geotiff(str(tmp_path / "elevation.tif"), data, (10.0, 20.0), 2.0)
+    grid, georef = read_grid(str(tmp_path / "elevation.tif"))
+    write_layer(str(tmp_path / binary_name("elevation.tif")), grid, georef)
+    binary, binary_georef = read_grid(str(tmp_path / "elevation.tlb"))
+    np.testing.assert_array_equal(binary, grid)
+    assert binary_georef.key == georef.key
+
+    lines = [np.random.rand(4, 3), np.random.rand(3, 3)]
+    write_shapefile(str(tmp_path / "trail.shp"), [l[:, :2] for l in lines])
+    parts = read_lines(str(tmp_path / "trail.shp"))
+    for part, line in zip(parts, lines):
+        np.testing.assert_allclose(np.asarray(part)[:, :2], line[:, :2])
+
+    rgb = np.random.randint(0, 256, (5, 4, 3)).astype(np.uint8)
+    write_png(str(tmp_path / "patch_class1.png"), rgb)
+    image = read_image(str(tmp_path / "patch_class1.png"))
+    write_layer(str(tmp_path / binary_name("patch_class1.png")), image)
+    np.testing.assert_array_equal(read_image(str(tmp_path / "patch_class1.tlb")), image)
+    np.testing.assert_array_equal(image[..., :3], rgb)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        [],
+        {"dtype": "<f4", "shape": [2, 2]},
+        {"kind": "raster", "dtype": "<f4"},
+        {"kind": "raster", "dtype": "<f4", "shape": [2, 2], "origin": [0, 0]},
+        {"kind": "lines", "dtype": "<f8", "shape": [2, 3]},
+        {"kind": "lines", "dtype": "<f8", "shape": [2, 3], "parts": [3, -1]},
+        {"kind": "raster", "dtype": "<f4", "shape": [1000, 1000]},
+    ],
+)
+def test_malformed_header(tmp_path, header):
+    path = str(tmp_path / "layer.tlb")
+    text = json.dumps(header).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(b"TLB1" + struct.pack("<I", len(text)) + text + bytes(48))
+    for read in (read_grid, read_lines, read_image):
+        with pytest.raises(RuntimeError):
+            read(path)
@@ -0,0 +1,73 @@
+import numpy as np
+
+from addon.grid import lod_layout, uniform_layout
+from addon.raster import GeoRef
+
+SIZE = 257
+
+
+def terrain(offset=0.0):
+    rng = np.random.default_rng(1)
+    data = rng.uniform(0, 5, (SIZE, SIZE)).astype(np.float32) + offset
+    georef = GeoRef((1000.0, 2000.0 + SIZE), (1.0, -1.0), (SIZE, SIZE))
+    return data, georef, georef.center
+
+
+def near_vertices(layout, data, georef, origin, eye, radius=40):
+    co, _ = layout.arrays(data, georef, origin)
+    d = np.hypot(co[:, 0] - eye[0], co[:, 1] - eye[1])
+    return np.count_nonzero(d < radius)
+
+
+def test_eye_height_counts_above_the_terrain():
+    flat, georef, origin = terrain()
+    high = flat + 120
+    eye = (-100.0, 80.0, 5.0)
+    low_layout = lod_layout(flat, georef, origin, eye, near=16)
+    high_layout = lod_layout(high, georef, origin, (-100.0, 80.0, 125.0), near=16)
+    assert high_layout.key == low_layout.key
+    assert near_vertices(high_layout, high, georef, origin, eye) == near_vertices(
+        low_layout, flat, georef, origin, eye
+    )
+
+
+def test_near_field_is_as_fine_as_the_uniform_step():
+    data, georef, origin = terrain(offset=120)
+    eye = (0.0, 0.0, 125.0)
+    lod = lod_layout(data, georef, origin, eye, step=2, near=64)
+    uniform = uniform_layout(georef.shape, 2)
+    assert near_vertices(lod, data, georef, origin, eye, 10) >= near_vertices(
+        uniform, data, georef, origin, eye, 10
+    )
+    assert len(lod.i0) < len(uniform.i0)
+
+
+def test_stitched_edges_have_no_cracks():
+    data, georef, origin = terrain(offset=300)
+    eye = (-120.0, 120.0, 302.0)
+    layout = lod_layout(data, georef, origin, eye, near=8, block=32)
+    assert len(set(layout.key[2])) > 1
+    z = layout.heights(data)
+    rows, cols = layout.rows, layout.cols
+    faces = layout.faces
+    edges = np.concatenate([faces[:, [k, (k + 1) % 4]] for k in range(4)])
+    a, b = edges[:, 0], edges[:, 1]
+    # vertices lying inside an edge of a neighbouring block follow that edge
+    for along, across in ((rows, cols), (cols, rows)):
+        line = along[a] == along[b]
+        lo = np.minimum(across[a], across[b])[line]
+        hi = np.maximum(across[a], across[b])[line]
+        za, zb = z[a][line], z[b][line]
+        fa = across[a][line]
+        on = (along[:, None] == along[a][line][None, :]) & (
+            (across[:, None] > lo) & (across[:, None] < hi)
+        )
+        v, e = np.nonzero(on)
+        t = (across[v] - fa[e]) / (across[b][line][e] - fa[e])
+        expected = za[e] * (1 - t) + zb[e] * t
+        np.testing.assert_allclose(z[v], expected, rtol=0, atol=1e-3)
+    # vertices shared by two blocks have one height
+    key = rows.astype(np.int64) * SIZE + cols
+    order = np.argsort(key, kind="stable")
+    same = key[order][1:] == key[order][:-1]
+    np.testing.assert_allclose(z[order][1:][same], z[order][:-1][same], atol=1e-3)
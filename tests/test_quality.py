@@ -0,0 +1,102 @@
+import pytest
+
+from addon import quality
+from addon.quality import Governor
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(quality, "timer", clock)
+    return clock
+
+
+def draw(governor, clock, interval, count, region=1):
+    for _ in range(count):
+        clock.now += interval
+        governor.draw(region)
+
+
+def test_slow_frames_step_down(clock):
+    governor = Governor("High", fps=60, cooldown=0)
+    draw(governor, clock, 1 / 20, 40)
+    assert governor.decide() == "Medium"
+
+
+def test_fast_frames_step_up(clock):
+    governor = Governor("Low", fps=30, cooldown=0)
+    draw(governor, clock, 1 / 120, 40)
+    assert governor.decide() == "Medium"
+
+
+def test_idle_gaps_are_not_frames(clock):
+    governor = Governor("High", fps=60, cooldown=0)
+    for _ in range(40):
+        draw(governor, clock, 5.0, 1)
+    assert governor.decide() is None
+
+
+def test_old_frames_age_out(clock):
+    governor = Governor("High", fps=60, window=2.0, cooldown=0)
+    draw(governor, clock, 1 / 20, 40)
+    clock.now += 60
+    assert governor.decide() is None
+    assert not governor.frames
+
+
+def test_regions_are_timed_apart(clock):
+    governor = Governor("High", fps=60, cooldown=0)
+    for _ in range(40):
+        clock.now += 1 / 120
+        governor.draw(1)
+        governor.draw(2)
+    assert governor.decide() is None
+    assert min(seconds for _, seconds in governor.frames) > 0
+
+
+def test_slow_updates_step_down(clock):
+    governor = Governor("Medium", fps=60, update=1.0, cooldown=0)
+    draw(governor, clock, 1 / 120, 40)
+    governor.update(3.0)
+    assert governor.decide() == "Low"
+
+
+def test_vsync_jitter_does_not_step_down(clock):
+    governor = Governor("High", fps=60, cooldown=0)
+    for i in range(40):
+        draw(governor, clock, 1 / 60 + (0.002 if i % 3 else -0.001), 1)
+    assert governor.decide() is None
+
+
+def test_tier_recovers_at_vsync(clock):
+    governor = Governor("Low", fps=60, cooldown=0)
+    draw(governor, clock, 1 / 60, 40)
+    assert governor.decide() == "Medium"
+
+
+def test_failed_tier_waits_before_retrying(clock):
+    governor = Governor("High", fps=60, cooldown=0, backoff=30)
+    draw(governor, clock, 1 / 20, 40)
+    assert governor.decide() == "Medium"
+    draw(governor, clock, 1 / 60, 40)
+    assert governor.decide() is None
+    clock.now += 30
+    draw(governor, clock, 1 / 60, 40)
+    assert governor.decide() == "High"
+    # failing again doubles the wait
+    draw(governor, clock, 1 / 20, 40)
+    assert governor.decide() == "Medium"
+    clock.now += 30
+    draw(governor, clock, 1 / 60, 40)
+    assert governor.decide() is None
+    clock.now += 30
+    draw(governor, clock, 1 / 60, 40)
+    assert governor.decide() == "High"
@@ -0,0 +1,102 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from addon.benchmark import write_geotiff, write_png
+from addon.raster import read_geotiff, read_png
+
+
+def paeth(left, up, upleft):
+    p = left + up - upleft
+    pa, pb, pc = abs(p - left), abs(p - up), abs(p - upleft)
+    if pa <= pb and pa <= pc:
+        return left
+    return up if pb <= pc else upleft
+
+
+def filtered(lines, kinds, bpp):
+    """PNG scanlines of (rows, stride) bytes, filtered the slow obvious way"""
+    lines = lines.astype(int)
+    out = bytearray()
+    for r, kind in enumerate(kinds):
+        out.append(kind)
+        for i in range(lines.shape[1]):
+            left = lines[r, i - bpp] if i >= bpp else 0
+            up = lines[r - 1, i] if r else 0
+            upleft = lines[r - 1, i - bpp] if r and i >= bpp else 0
+            pred = (0, left, up, (left + up) >> 1, paeth(left, up, upleft))[kind]
+            out.append((lines[r, i] - pred) & 0xFF)
+    return bytes(out)
+
+
+def write_rgba_png(path, rgba, kinds):
+    def chunk(kind, content):
+        crc = zlib.crc32(kind + content) & 0xFFFFFFFF
+        return struct.pack(">I", len(content)) + kind + content + struct.pack(">I", crc)
+
+    rows, cols = rgba.shape[:2]
+    lines = filtered(rgba.reshape(rows, -1), kinds, 4)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", cols, rows, 8, 6, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(lines)))
+        f.write(chunk(b"IEND", b""))
+
+
+@pytest.mark.parametrize(
+    "kinds", [[0] * 9, [1] * 9, [2] * 9, [3] * 9, [4] * 9, [0, 1, 2, 3, 4, 4, 3, 2, 1]]
+)
+def test_png_filters(tmp_path, kinds):
+    path = str(tmp_path / "patch_class1.png")
+    rgba = np.random.RandomState(len(set(kinds))).randint(0, 256, (9, 11, 4))
+    rgba = rgba.astype(np.uint8)
+    write_rgba_png(path, rgba, kinds)
+    np.testing.assert_array_equal(read_png(path), rgba)
+
+
+def test_png_rgb_gets_opaque_alpha(tmp_path):
+    path = str(tmp_path / "patch_class1.png")
+    rgb = np.random.randint(0, 256, (6, 5, 3)).astype(np.uint8)
+    write_png(path, rgb)
+    rgba = read_png(path)
+    np.testing.assert_array_equal(rgba[..., :3], rgb)
+    assert (rgba[..., 3] == 255).all()
+
+
+def test_not_a_png(tmp_path):
+    path = tmp_path / "patch_class1.png"
+    path.write_bytes(b"not a png")
+    with pytest.raises(RuntimeError):
+        read_png(str(path))
+
+
+def test_geotiff_round_trip(tmp_path):
+    path = str(tmp_path / "elevation.tif")
+    data = np.random.rand(5, 8).astype(np.float32) * 100
+    data[2, 3] = np.nan
+    write_geotiff(path, data, (630000.0, 215500.0), 2.0)
+    grid, georef = read_geotiff(path)
+    np.testing.assert_array_equal(grid, data)
+    assert georef.origin == (630000.0, 215500.0)
+    assert georef.pixel_size == (2.0, -2.0)
+    assert georef.shape == (5, 8)
+
+
+def test_geotiff_sub_byte_samples(tmp_path):
+    path = tmp_path / "elevation.tif"
+    write_geotiff(str(path), np.zeros((4, 4), np.float32), (0.0, 0.0), 1.0)
+    entry = struct.pack("<HHIH", 258, 3, 1, 32)
+    raw = path.read_bytes()
+    assert raw.count(entry) == 1
+    path.write_bytes(raw.replace(entry, struct.pack("<HHIH", 258, 3, 1, 4)))
+    with pytest.raises(RuntimeError, match="4 bit"):
+        read_geotiff(str(path))
+
+
+def test_png_taller_than_a_band(tmp_path):
+    path = str(tmp_path / "patch_class1.png")
+    rgba = np.random.randint(0, 256, (600, 3, 4)).astype(np.uint8)
+    write_rgba_png(path, rgba, [4, 3] * 300)
+    np.testing.assert_array_equal(read_png(path), rgba)
@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from addon import settings
+
+VALID = {
+    "folder": "/tmp/",
+    "CRS": "3358",
+    "timer": 5,
+    "scale": 1,
+    "terrain": {"grass_texture_file": "grass.jpg", "sides_texture_file": "dirt.jpg"},
+    "trees": {"class1": {"model": "maple.blend", "density": 80}},
+    "trail": {"profile": "profile.blend", "texture_file": "boardwalk.png"},
+    "world": {"texture_file": "sky.jpg"},
+    "qa": {"enabled": True, "samples": None},
+}
+
+
+@pytest.fixture
+def cfg(tmp_path, monkeypatch):
+    path = str(tmp_path / "settings.json")
+    monkeypatch.setattr(settings, "cfgFile", path)
+    monkeypatch.setattr(settings, "_cache", {"mtime": None, "prefs": None})
+    monkeypatch.setattr(settings, "_notified", {"prefs": None})
+    monkeypatch.setattr(settings, "_listeners", [])
+    return path
+
+
+def write(path, prefs, mtime):
+    with open(path, "w") as f:
+        json.dump(prefs, f)
+    os.utime(path, (mtime, mtime))
+
+
+def test_valid_settings_pass():
+    settings.validateSettings(VALID)
+
+
+@pytest.mark.parametrize(
+    "key, value",
+    [
+        ("lod", "yes"),
+        ("terrain_tile", True),
+        ("socket", 8000),
+        ("qa", {"thickness": "thin"}),
+        ("water", []),
+        ("trees", {"class1": {"model": "maple.blend", "density": "dense"}}),
+    ],
+)
+def test_optional_keys_are_typed(key, value):
+    prefs = dict(VALID, **{key: value})
+    with pytest.raises(ValueError, match=key):
+        settings.validateSettings(prefs)
+
+
+def test_reading_settings_does_not_hide_a_change(cfg):
+    seen = []
+    settings.addSettingsListener(seen.append)
+    write(cfg, VALID, 1000)
+    settings.getSettings()
+    assert not settings.checkSettings()
+    write(cfg, dict(VALID, timer=2), 2000)
+    assert settings.getSettings()["timer"] == 2
+    assert settings.checkSettings()
+    assert [prefs["timer"] for prefs in seen] == [2]
+    assert not settings.checkSettings()
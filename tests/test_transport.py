@@ -0,0 +1,80 @@
+import os
+import time
+
+import pytest
+
+from addon.transport import LayerServer, parse_address, send_layer
+
+
+def layer(name):
+    return name in ("elevation.tif", "water.tif")
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = LayerServer(str(tmp_path / "layers.sock"), layer, str(tmp_path))
+    yield server
+    server.close()
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def received(server, count=1, timeout=5):
+    found = {}
+    end = time.time() + timeout
+    while len(found) < count and time.time() < end:
+        found.update(server.take())
+        time.sleep(0.01)
+    return found
+
+
+def test_parse_address():
+    assert parse_address("localhost:5000") == ("localhost", 5000)
+    assert parse_address(":5000") == ("localhost", 5000)
+    assert parse_address("/tmp/layers.sock") == "/tmp/layers.sock"
+
+
+def test_layer_arrives_as_a_file(tmp_path, server):
+    path = write(tmp_path, "elevation.tif", b"x" * 100000)
+    send_layer(server.address, path, 1)
+    files = received(server)
+    received_path, arrived = files["elevation.tif"]
+    assert server.owns(received_path)
+    with open(received_path, "rb") as f:
+        assert f.read() == b"x" * 100000
+    server.discard(received_path)
+    assert not os.path.exists(received_path)
+
+
+def test_older_sequence_is_dropped(tmp_path, server):
+    send_layer(server.address, write(tmp_path, "elevation.tif", b"new"), 5)
+    assert received(server)
+    send_layer(server.address, write(tmp_path, "elevation.tif", b"old"), 4)
+    send_layer(server.address, write(tmp_path, "water.tif", b"water"), 1)
+    files = received(server)
+    assert list(files) == ["water.tif"]
+
+
+def test_newest_message_wins(tmp_path, server):
+    for sequence in (1, 2, 3):
+        data = str(sequence).encode()
+        send_layer(server.address, write(tmp_path, "elevation.tif", data), sequence)
+    seen = []
+    end = time.time() + 5
+    while seen[-1:] != [b"3"] and time.time() < end:
+        for path, arrived in server.take().values():
+            with open(path, "rb") as f:
+                seen.append(f.read())
+        time.sleep(0.01)
+    assert seen[-1] == b"3"
+    assert seen == sorted(seen)
+
+
+def test_unknown_layers_are_ignored(tmp_path, server):
+    send_layer(server.address, write(tmp_path, "notes.txt", b"hello"), 1)
+    send_layer(server.address, write(tmp_path, "water.tif", b"water"), 1)
+    assert list(received(server)) == ["water.tif"]
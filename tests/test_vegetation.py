@@ -0,0 +1,54 @@
+import numpy as np
+
+from addon.vegetation import (
+    class_seed,
+    fingerprint,
+    instance_quads,
+    patch_density,
+    sample_points,
+)
+
+
+def test_patch_density_follows_brightness_and_alpha():
+    rgba = np.zeros((2, 3, 4), dtype=np.uint8)
+    rgba[0, :, :3] = 255
+    rgba[..., 3] = 255
+    rgba[0, 0, 3] = 0
+    density = patch_density(rgba)
+    # bottom row first
+    np.testing.assert_allclose(density[1], [0, 1, 1])
+    np.testing.assert_allclose(density[0], [0, 0, 0])
+
+
+def test_fingerprint_changes_with_contents():
+    density = np.zeros((4, 4), dtype=np.float32)
+    before = fingerprint(density)
+    assert fingerprint(density.copy()) == before
+    density[2, 1] = 0.5
+    assert fingerprint(density) != before
+
+
+def test_class_seed_is_stable():
+    assert class_seed("class1") == class_seed("class1")
+    assert class_seed("class1") != class_seed("class2")
+
+
+def test_points_follow_density():
+    density = np.zeros((10, 10), dtype=np.float32)
+    density[:, 5:] = 1
+    extent = (0.0, 0.0, 100.0, 100.0)
+    xy, angle, sizes = sample_points(density, extent, 0.05, seed=1)
+    assert len(xy) > 100
+    assert (xy[:, 0] >= 50).all() and (xy[:, 0] <= 100).all()
+    assert (xy[:, 1] >= 0).all() and (xy[:, 1] <= 100).all()
+    again = sample_points(density, extent, 0.05, seed=1)[0]
+    np.testing.assert_array_equal(xy, again)
+
+
+def test_instance_quads_are_centered_and_sized():
+    co = np.array([[1.0, 2.0, 3.0], [-4.0, 0.0, 1.0]])
+    co_out, faces = instance_quads(co, np.array([0.0, 1.0]), np.array([1.0, 2.0]))
+    quads = co_out[faces]
+    np.testing.assert_allclose(quads.mean(axis=1), co, atol=1e-6)
+    side = np.linalg.norm(quads[:, 1] - quads[:, 0], axis=1)
+    np.testing.assert_allclose(side, [1.0, 2.0], atol=1e-6)
@@ -0,0 +1,86 @@
+import os
+import time
+
+from addon.watcher import Ingest
+
+
+def layer(name):
+    return name in ("elevation.tif", "vantage.shp") or name.startswith("patch_")
+
+
+def write(folder, name, data=b"data", age=10):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    t = time.time() - age
+    os.utime(path, (t, t))
+    return path
+
+
+def test_settled_file_is_ready(tmp_path):
+    folder = str(tmp_path)
+    write(folder, "elevation.tif")
+    ingest = Ingest(folder, settle=0.25, accept=layer)
+    assert ingest.ready(os.listdir(folder)) == ["elevation.tif"]
+    ingest.done("elevation.tif")
+    assert not ingest.waiting()
+
+
+def test_fresh_file_waits_to_settle(tmp_path):
+    folder = str(tmp_path)
+    write(folder, "elevation.tif", age=0)
+    ingest = Ingest(folder, settle=60, accept=layer)
+    assert ingest.ready(os.listdir(folder)) == []
+    assert ingest.waiting()
+
+
+def test_changed_file_waits_for_another_listing(tmp_path):
+    folder = str(tmp_path)
+    write(folder, "elevation.tif")
+    ingest = Ingest(folder, accept=layer)
+    ingest.ready(os.listdir(folder))
+    write(folder, "elevation.tif", b"newer data", age=5)
+    assert ingest.ready(os.listdir(folder)) == []
+    assert ingest.ready(os.listdir(folder)) == ["elevation.tif"]
+
+
+def test_temporary_and_unknown_files_are_ignored(tmp_path):
+    folder = str(tmp_path)
+    for name in (".elevation.tif", "elevation.tif.part", "notes.txt"):
+        write(folder, name)
+    ingest = Ingest(folder, accept=layer)
+    assert ingest.ready(os.listdir(folder)) == []
+    assert not ingest.waiting()
+
+
+def test_shapefile_sidecars_do_not_keep_waiting(tmp_path):
+    folder = str(tmp_path)
+    for ext in (".shp", ".shx", ".dbf", ".prj", ".cpg"):
+        write(folder, "vantage" + ext)
+    ingest = Ingest(folder, accept=layer)
+    assert ingest.ready(os.listdir(folder)) == ["vantage.shp"]
+    ingest.done("vantage.shp")
+    assert not ingest.waiting()
+
+
+def test_failed_file_is_skipped_until_it_changes(tmp_path):
+    folder = str(tmp_path)
+    write(folder, "patch_class1.png")
+    ingest = Ingest(folder, accept=layer)
+    assert ingest.ready(os.listdir(folder)) == ["patch_class1.png"]
+    ingest.failed("patch_class1.png")
+    assert ingest.ready(os.listdir(folder)) == []
+    assert not ingest.waiting()
+    write(folder, "patch_class1.png", b"fixed", age=5)
+    ingest.ready(os.listdir(folder))
+    assert ingest.ready(os.listdir(folder)) == ["patch_class1.png"]
+
+
+def test_removed_file_is_forgotten(tmp_path):
+    folder = str(tmp_path)
+    path = write(folder, "elevation.tif", age=0)
+    ingest = Ingest(folder, settle=60, accept=layer)
+    ingest.ready(os.listdir(folder))
+    os.remove(path)
+    ingest.ready(os.listdir(folder))
+    assert not ingest.waiting()
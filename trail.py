@@ -0,0 +1,61 @@
+import numpy as np
+
+
+def resample_line(line, spacing):
+    """Points evenly spaced along a polyline, its vertices are not kept"""
+    segments = np.hypot(*np.diff(line[:, :2], axis=0).T)
+    distance = np.r_[0, np.cumsum(segments)]
+    count = max(int(np.ceil(distance[-1] / spacing)), 1) + 1
+    t = np.linspace(0, distance[-1], count)
+    return np.column_stack([np.interp(t, distance, line[:, i]) for i in range(2)])
+
+
+def fill_gaps(values):
+    """Replaces NaN by interpolating between valid neighbours"""
+    valid = np.isfinite(values)
+    if valid.all() or not valid.any():
+        return values
+    index = np.arange(len(values))
+    return np.interp(index, index[valid], values[valid])
+
+
+def smooth(values, factor=0.5, iterations=2):
+    """Moves inner values towards their neighbours, like the Smooth modifier"""
+    values = values.copy()
+    for _ in range(iterations):
+        values[1:-1] += factor * ((values[:-2] + values[2:]) / 2 - values[1:-1])
+    return values
+
+
+def sweep(path, profile, closed=False):
+    """Mesh of a profile swept along a path, keeping the profile upright.
+
+    Profile x goes to the right of the path and y up, as a curve bevel
+    with Z up twist does. Returns vertices, quads and per vertex uvs with
+    u across the profile and v along the path.
+    """
+    n = len(path)
+    m = len(profile)
+    tangent = np.gradient(path[:, :2], axis=0)
+    length = np.hypot(tangent[:, 0], tangent[:, 1])
+    length[length == 0] = 1
+    side = np.zeros((n, 3))
+    side[:, 0] = tangent[:, 1] / length
+    side[:, 1] = -tangent[:, 0] / length
+    co = (
+        path[:, np.newaxis, :]
+        + profile[np.newaxis, :, 0, np.newaxis] * side[:, np.newaxis, :]
+    )
+    co[..., 2] += profile[np.newaxis, :, 1]
+
+    ring = np.arange(m if closed else m - 1)
+    start = np.arange(n - 1)[:, np.newaxis] * m
+    a = start + ring
+    b = start + (ring + 1) % m
+    faces = np.stack([a, b, b + m, a + m], axis=-1).reshape(-1, 4)
+
+    distance = np.r_[0, np.cumsum(np.hypot(*np.diff(path[:, :2], axis=0).T))]
+    uv = np.empty((n, m, 2), dtype=np.float32)
+    uv[..., 0] = np.arange(m) / (m if closed else m - 1)
+    uv[..., 1] = (distance / max(distance[-1], 1e-9))[:, np.newaxis]
+    return co.reshape(-1, 3), faces.astype(np.int32), uv.reshape(-1, 2)
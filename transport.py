@@ -0,0 +1,171 @@
+"""Layer updates pushed over a local socket instead of the watch folder.
+
+A client connects to a Unix domain socket, or to host:port on localhost,
+and sends any number of messages, each
+
+    magic       b"TLM1"
+    name        length, little endian uint32
+    sequence    little endian uint64, growing per layer, 0 starts over
+    size        payload length, little endian uint64
+    name        utf-8 layer file name, as it would be in the watch folder
+    payload     size bytes of the file
+
+Payloads are streamed into memory backed files, so the handlers read them
+as if they came from the watch folder. Only the newest message of a layer
+is kept, older and repeated sequence numbers are dropped.
+"""
+
+import os
+import shutil
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+
+HEADER = struct.Struct("<4sIQQ")
+MAGIC = b"TLM1"
+CHUNK = 1 << 20
+
+
+def parse_address(address):
+    """host:port for TCP, anything else is the path of a Unix socket"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return (host or "localhost", int(port))
+    return address
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            header = self._read(HEADER.size)
+            if header is None:
+                return
+            magic, length, sequence, size = HEADER.unpack(header)
+            if magic != MAGIC:
+                print("Dropping connection with a bad layer message")
+                return
+            name = self._read(length)
+            if name is None:
+                return
+            name = os.path.basename(name.decode("utf-8", "replace"))
+            if not self.server.layer.receive(name, sequence, size, self):
+                return
+
+    def _read(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return bytes(data)
+
+    def copy(self, f, size):
+        """Streams size payload bytes into a file, False on a cut connection"""
+        buf = bytearray(min(size, CHUNK))
+        view = memoryview(buf)
+        while size:
+            n = self.request.recv_into(view, min(size, len(buf)))
+            if not n:
+                return False
+            f.write(view[:n])
+            size -= n
+        return True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LayerServer:
+    """Receives layer messages on background threads.
+
+    The main thread takes the newest file of every layer with take() and
+    hands it back with discard() once it was applied.
+    """
+
+    def __init__(self, address, accept, folder=None):
+        # accept tells whether a file name is a layer
+        self.accept = accept
+        self.folder = tempfile.mkdtemp(prefix="tl_socket_", dir=folder)
+        self.address = parse_address(address)
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._sequence = {}
+        if isinstance(self.address, tuple):
+            self._server = _TCPServer(self.address, _Handler)
+        else:
+            if os.path.exists(self.address):
+                # left behind by a session that did not shut down
+                os.remove(self.address)
+            self._server = _UnixServer(self.address, _Handler)
+        self._server.layer = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def receive(self, name, sequence, size, handler):
+        """Stores one payload, returns False when the connection broke"""
+        directory = tempfile.mkdtemp(dir=self.folder)
+        path = os.path.join(directory, name or "unnamed")
+        with open(path, "wb") as f:
+            complete = handler.copy(f, size)
+        if not complete or not self.accept(name):
+            if complete:
+                print("Ignoring unknown layer {}".format(name))
+            self.discard(path)
+            return complete
+        with self._lock:
+            if sequence and sequence <= self._sequence.get(name, -1):
+                stale = path
+            else:
+                self._sequence[name] = sequence
+                stale = self._latest.get(name, (None,))[0]
+                self._latest[name] = path, time.time()
+        if stale:
+            self.discard(stale)
+        return True
+
+    def take(self):
+        """Newest unclaimed file of every layer, as paths and arrival times"""
+        with self._lock:
+            latest, self._latest = self._latest, {}
+        return latest
+
+    def owns(self, path):
+        return path.startswith(self.folder + os.sep)
+
+    def discard(self, path):
+        """Removes a received file once it is not needed anymore"""
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        if not isinstance(self.address, tuple):
+            try:
+                os.remove(self.address)
+            except OSError:
+                pass
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def send_layer(address, path, sequence, name=None):
+    """Pushes a layer file to a running LayerServer, for GRASS side scripts"""
+    address = parse_address(address)
+    name = (name or os.path.basename(path)).encode("utf-8")
+    size = os.path.getsize(path)
+    family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+    with socket.socket(family, socket.SOCK_STREAM) as s:
+        s.connect(address)
+        s.sendall(HEADER.pack(MAGIC, len(name), sequence, size) + name)
+        with open(path, "rb") as f:
+            s.sendfile(f)
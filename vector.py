@@ -0,0 +1,65 @@
+import struct
+
+import numpy as np
+
+# shape types with their coordinate layout
+POINT_TYPES = (1, 11, 21)
+MULTIPOINT_TYPES = (8, 18, 28)
+POLY_TYPES = (3, 5, 13, 15, 23, 25)
+Z_TYPES = (11, 13, 15, 18)
+
+
+def read_shapefile(path):
+    """Reads the geometries of a shapefile.
+
+    Returns a list of parts, each an (n, 3) float64 array of projected
+    coordinates. Z is 0 for 2D shapes.
+    """
+    try:
+        return _read_shapefile(path)
+    except (struct.error, ValueError, IndexError) as e:
+        raise RuntimeError("Could not read {}: {}".format(path, e))
+
+
+def _read_shapefile(path):
+    with open(path, "rb") as f:
+        content = f.read()
+    (code,) = struct.unpack(">i", content[:4])
+    if code != 9994:
+        raise RuntimeError("{} is not a shapefile".format(path))
+    (length,) = struct.unpack(">i", content[24:28])
+    if len(content) < length * 2:
+        raise RuntimeError("Truncated shapefile {}".format(path))
+    parts = []
+    pos = 100
+    while pos + 8 <= length * 2:
+        _, size = struct.unpack(">ii", content[pos : pos + 8])
+        record = content[pos + 8 : pos + 8 + size * 2]
+        pos += 8 + size * 2
+        (shape,) = struct.unpack("<i", record[:4])
+        if shape in POINT_TYPES:
+            x, y = struct.unpack("<2d", record[4:20])
+            z = struct.unpack("<d", record[20:28])[0] if shape in Z_TYPES else 0
+            parts.append(np.array([[x, y, z]]))
+            continue
+        if shape in MULTIPOINT_TYPES:
+            (n,) = struct.unpack("<i", record[36:40])
+            starts = [0]
+            offset = 40
+        elif shape in POLY_TYPES:
+            nparts, n = struct.unpack("<2i", record[36:44])
+            starts = struct.unpack("<%di" % nparts, record[44 : 44 + 4 * nparts])
+            starts = list(starts)
+            offset = 44 + 4 * nparts
+        else:
+            # null shape
+            continue
+        xy = np.frombuffer(record, dtype="<f8", count=2 * n, offset=offset)
+        co = np.zeros((n, 3))
+        co[:, :2] = xy.reshape(-1, 2)
+        if shape in Z_TYPES:
+            offset += 16 * n + 16
+            co[:, 2] = np.frombuffer(record, dtype="<f8", count=n, offset=offset)
+        for start, end in zip(starts, starts[1:] + [n]):
+            parts.append(co[start:end])
+    return parts
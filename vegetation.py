@@ -0,0 +1,65 @@
+import zlib
+
+import numpy as np
+
+
+def patch_density(rgba):
+    """Tree density between 0 and 1 of patch pixels, bottom row first"""
+    rgba = rgba[::-1]
+    alpha = rgba[..., 3] / np.float32(255 * 255)
+    return (rgba[..., :3].mean(axis=2, dtype=np.float32) * alpha).astype(np.float32)
+
+
+def fingerprint(array):
+    """Checksum of array contents telling whether a patch changed"""
+    return zlib.crc32(np.ascontiguousarray(array).view(np.uint8))
+
+
+def class_seed(name):
+    """Stable random seed of a tree class, the same in every session"""
+    return zlib.crc32(name.encode())
+
+
+def sample_points(density, extent, rate, seed, size=1, size_random=0.5):
+    """Random tree placement following a density grid.
+
+    The grid covers extent (xmin, ymin, xmax, ymax) with its bottom row
+    first. Every cell gets a Poisson distributed number of trees with mean
+    density * rate * cell area, so the total follows the covered area.
+    The same density and seed always give the same trees.
+    Returns (n, 2) positions, (n,) rotations around z and (n,) sizes.
+    """
+    rows, cols = density.shape
+    xmin, ymin, xmax, ymax = extent
+    dx = (xmax - xmin) / cols
+    dy = (ymax - ymin) / rows
+    rng = np.random.RandomState(seed)
+    cells = np.flatnonzero(density > 0)
+    counts = rng.poisson(density.ravel()[cells] * rate * dx * dy)
+    cells = np.repeat(cells, counts)
+    r, c = np.divmod(cells, cols)
+    jitter = rng.random_sample((len(cells), 2))
+    xy = np.empty((len(cells), 2))
+    xy[:, 0] = xmin + (c + jitter[:, 0]) * dx
+    xy[:, 1] = ymin + (r + jitter[:, 1]) * dy
+    angle = rng.uniform(0, 2 * np.pi, len(cells))
+    sizes = size * (1 - size_random * rng.random_sample(len(cells)))
+    return xy, angle, sizes
+
+
+def instance_quads(co, angle, sizes):
+    """One upward facing quad per instance for face instancing.
+
+    Blender places an instance at every face center, rotated like the
+    face and scaled by the square root of its area.
+    """
+    n = len(co)
+    corners = np.array([[0.5, 0.5], [-0.5, 0.5], [-0.5, -0.5], [0.5, -0.5]])
+    cos = np.cos(angle)[:, np.newaxis] * sizes[:, np.newaxis]
+    sin = np.sin(angle)[:, np.newaxis] * sizes[:, np.newaxis]
+    quads = np.empty((n, 4, 3), dtype=np.float32)
+    quads[:, :, 0] = co[:, np.newaxis, 0] + cos * corners[:, 0] - sin * corners[:, 1]
+    quads[:, :, 1] = co[:, np.newaxis, 1] + sin * corners[:, 0] + cos * corners[:, 1]
+    quads[:, :, 2] = co[:, np.newaxis, 2]
+    faces = np.arange(4 * n, dtype=np.int32).reshape(n, 4)
+    return quads.reshape(-1, 3), faces
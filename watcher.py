@@ -0,0 +1,188 @@
+import os
+import sys
+import time
+import select
+import threading
+import ctypes
+import ctypes.util
+from timeit import default_timer as timer
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+class PollingWatcher:
+    """Lists the watch folder on every timer tick"""
+
+    def __init__(self, folder, interval):
+        self.folder = folder
+        self.interval = interval
+        # timer interval the modal operator should run at
+        self.tick = interval
+
+    def poll(self, force=False):
+        """Returns the folder listing, or None when nothing needs checking"""
+        return os.listdir(self.folder)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Gets close-write and moved-to events of the watch folder on a thread.
+
+    The modal operator ticks fast but only lists the folder after an event,
+    or every interval seconds as a safety net for missed events.
+    """
+
+    def __init__(self, folder, interval, tick=0.05):
+        self.folder = folder
+        self.interval = interval
+        self.tick = tick
+        self._event = threading.Event()
+        self._stop = False
+        self._last = timer()
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(
+            self._fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO
+        )
+        if wd < 0:
+            os.close(self._fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed", folder)
+        # files already waiting in the folder
+        self._event.set()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop:
+            ready, _, _ = select.select([self._fd], [], [], 0.5)
+            if not ready:
+                continue
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                break
+            # any complete write or rename into the folder is worth a listing
+            if buf:
+                self._event.set()
+
+    def poll(self, force=False):
+        now = timer()
+        if not (force or self._event.is_set()) and now - self._last < self.interval:
+            return None
+        self._event.clear()
+        self._last = now
+        return os.listdir(self.folder)
+
+    def close(self):
+        self._stop = True
+        self._thread.join()
+        os.close(self._fd)
+
+
+class Ingest:
+    """Filters folder listings down to complete layer files.
+
+    A file is complete once it has not been modified for settle seconds and
+    looks the same as on the previous listing. Files still being written
+    under a temporary name (leading dot, .part or .tmp) are ignored, so
+    writers can also rename finished files into place. Every layer has a
+    single file name, a newer version replaces the pending one and only the
+    version which settles gets processed. Other files, like the sidecars of
+    a shapefile, are left out when accept tells they are not layers.
+    """
+
+    def __init__(self, folder, settle=0.25, accept=None):
+        self.folder = folder
+        self.settle = settle
+        self.accept = accept
+        self.pending = {}
+        self._failed = {}
+
+    def _signature(self, name):
+        path = os.path.join(self.folder, name)
+        stem, ext = os.path.splitext(name)
+        paths = [path]
+        if ext == ".shp":
+            # a shapefile is complete only with its sidecar files
+            paths += [
+                os.path.join(self.folder, stem + e) for e in (".shx", ".dbf", ".prj")
+            ]
+        size = 0
+        mtime = 0
+        for p in paths:
+            try:
+                st = os.stat(p)
+            except FileNotFoundError:
+                if p == path:
+                    return None
+                continue
+            size += st.st_size
+            mtime = max(mtime, st.st_mtime_ns)
+        return size, mtime
+
+    def ready(self, names):
+        """Returns the names of files that are complete and not yet failed"""
+        now = time.time()
+        ready = []
+        listed = set()
+        for name in names:
+            if name.startswith(".") or name.endswith((".part", ".tmp")):
+                continue
+            if self.accept and not self.accept(name):
+                continue
+            sig = self._signature(name)
+            if sig is None:
+                continue
+            listed.add(name)
+            previous = self.pending.get(name)
+            self.pending[name] = sig
+            if previous is not None and previous != sig:
+                continue
+            if now - sig[1] / 1e9 < self.settle:
+                continue
+            if self._failed.get(name) == sig:
+                continue
+            ready.append(name)
+        for name in list(self.pending):
+            if name not in listed:
+                del self.pending[name]
+                self._failed.pop(name, None)
+        return ready
+
+    def age(self, name):
+        """Seconds since the listed version of a file was last modified"""
+        return time.time() - self.pending[name][1] / 1e9
+
+    def waiting(self):
+        """True when a file was seen but has not settled yet"""
+        return any(self._failed.get(n) != sig for n, sig in self.pending.items())
+
+    def failed(self, name):
+        """Skips this version of the file until it changes"""
+        sig = self._signature(name)
+        if sig is not None:
+            self._failed[name] = sig
+
+    def done(self, name):
+        self.pending.pop(name, None)
+        self._failed.pop(name, None)
+
+
+def create_watcher(folder, interval):
+    """Uses inotify on Linux and falls back to polling elsewhere"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folder, interval)
+        except (OSError, AttributeError):
+            print("inotify not available, polling the watch folder")
+    return PollingWatcher(folder, interval)
@@ -0,0 +1,213 @@
+import glob
+import mmap
+import multiprocessing
+import os
+import sys
+import tempfile
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from timeit import default_timer as timer
+
+import numpy as np
+
+from .binary import read_image
+from .vegetation import fingerprint, patch_density
+
+
+def decode_patch(path):
+    """Decodes a tree patch image, returns its density grid and checksum"""
+    density = patch_density(read_image(path))
+    return density, fingerprint(density)
+
+
+class Decoder:
+    """Decodes layer files on a thread pool.
+
+    Jobs are keyed by file name, the main thread picks up finished results
+    and applies them to Blender data.
+    """
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = min(4, os.cpu_count() or 1)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.jobs = {}
+        # submitted, started and finished time of every job
+        self.times = {}
+
+    def _run(self, key, fn, args):
+        times = self.times[key]
+        times[1] = timer()
+        try:
+            return fn(*args)
+        finally:
+            times[2] = timer()
+
+    def submit(self, key, fn=None, *args):
+        """Starts decoding unless the same file is already in flight.
+
+        Without fn the file needs no decoding, it is only queued so that it
+        is applied in order with the other layers.
+        """
+        if key in self.jobs:
+            return
+        now = timer()
+        self.times[key] = [now, now, now]
+        if fn is None:
+            job = Future()
+            job.set_result(None)
+        else:
+            job = self.pool.submit(self._run, key, fn, args)
+        self.jobs[key] = job
+
+    def busy(self, key):
+        return key in self.jobs
+
+    def done(self, key):
+        return key in self.jobs and self.jobs[key].done()
+
+    def timing(self, key):
+        """Seconds a finished job spent queued, decoding and waiting since"""
+        submitted, started, finished = self.times[key]
+        return started - submitted, finished - started, timer() - finished
+
+    def result(self, key):
+        """Removes a finished job, raises whatever the decoding raised"""
+        self.times.pop(key, None)
+        return self.jobs.pop(key).result()
+
+    def close(self):
+        for job in self.jobs.values():
+            job.cancel()
+        self.jobs.clear()
+        self.times.clear()
+        self.pool.shutdown(wait=False)
+
+
+class SharedArray:
+    """Name of an array a worker process left in shared memory"""
+
+    def __init__(self, path):
+        self.path = path
+
+
+class MappedArray:
+    """Array a worker process mapped from a layer file, mapped again as is"""
+
+    def __init__(self, array):
+        self.path = array.filename
+        self.offset = array.offset
+        self.dtype = array.dtype.str
+        self.shape = array.shape
+
+
+def shared_folder():
+    """Folder backed by memory where workers leave their arrays"""
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def _share(value, folder, prefix):
+    if isinstance(value, np.memmap) and isinstance(value.base, mmap.mmap):
+        # a whole mapped file, binary layers need no copy
+        return MappedArray(value)
+    if isinstance(value, np.ndarray):
+        path = os.path.join(folder, "{}_{}.npy".format(prefix, uuid.uuid4().hex))
+        np.save(path, value)
+        return SharedArray(path)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_share(v, folder, prefix) for v in value)
+    return value
+
+
+def _attach(value):
+    if isinstance(value, SharedArray):
+        # the mapping stays valid after the name is gone
+        array = np.load(value.path, mmap_mode="r")
+        os.remove(value.path)
+        return array
+    if isinstance(value, MappedArray):
+        return np.memmap(value.path, value.dtype, "r", value.offset, value.shape)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_attach(v) for v in value)
+    return value
+
+
+def _publish(folder, prefix, fn, args):
+    """Runs a job in a worker process, arrays go back through shared memory"""
+    started = timer()
+    result = _share(fn(*args), folder, prefix)
+    return result, started, timer()
+
+
+class ProcessDecoder(Decoder):
+    """Decodes layer files in worker processes.
+
+    Keeps the parsing and array building off Blender's interpreter lock.
+    Result arrays are written to shared memory and mapped by the main
+    thread instead of being pickled through a pipe. Workers are forked
+    from Blender with its threads left behind, so jobs must not touch bpy
+    or locks those threads may hold, which is why they are opt-in. Jobs
+    held by a pool that lost a worker fail like any other decode, the
+    next job starts a new pool.
+    """
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = min(4, os.cpu_count() or 1)
+        self.workers = workers
+        self.folder = shared_folder()
+        self.prefix = "tl_{}_{}".format(os.getpid(), id(self))
+        self.pool = self._start()
+        self.jobs = {}
+        self.times = {}
+
+    def _start(self):
+        context = multiprocessing.get_context("fork")
+        return ProcessPoolExecutor(self.workers, mp_context=context)
+
+    def _finished(self, key, job):
+        if job.cancelled() or job.exception() is not None:
+            return
+        times = self.times.get(key)
+        if times is not None:
+            # perf_counter is system wide on Linux, comparable across processes
+            times[1:] = job.result()[1:]
+
+    def submit(self, key, fn=None, *args):
+        if fn is None or key in self.jobs:
+            return Decoder.submit(self, key, fn, *args)
+        now = timer()
+        self.times[key] = [now, now, now]
+        try:
+            job = self.pool.submit(_publish, self.folder, self.prefix, fn, args)
+        except BrokenProcessPool:
+            # a worker died, start over with fresh ones
+            self.pool = self._start()
+            job = self.pool.submit(_publish, self.folder, self.prefix, fn, args)
+        job.add_done_callback(lambda job: self._finished(key, job))
+        self.jobs[key] = job
+
+    def result(self, key):
+        try:
+            value = Decoder.result(self, key)
+        except BrokenProcessPool:
+            raise RuntimeError("worker process stopped decoding {}".format(key))
+        return None if value is None else _attach(value[0])
+
+    def close(self):
+        Decoder.close(self)
+        for path in glob.glob(os.path.join(self.folder, self.prefix + "_*")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def create_decoder(processes=False, workers=None):
+    """Process decoder where Blender can safely be forked, threads elsewhere"""
+    if processes and sys.platform.startswith("linux"):
+        return ProcessDecoder(workers)
+    return Decoder(workers)